@@ -4,10 +4,13 @@
 
 from PyQt5.QtWidgets import *
 from canvas import *
+from colony_renderer import *
 from colony import *
 from math import *
 from weighting_functions import *
 from colonyParams import *
+from simulation_worker import *
+from history import *
 
 DURATION = 5000
 
@@ -27,6 +30,11 @@ hive.cell(12, 11).defect()
 hive.settings.next_gen_type = "Perfect Best Response"
 hive.settings.weight_func = uniform_w
 
+# every change to the colony is made on this thread, the GUI only sends it commands and shows its frames
+# the states it produces are kept in a bounded history for the rewind slider
+history = History()
+worker = SimulationWorker(hive, history=history)
+
 # helper class for horizontal lines
 class QHLine(QFrame):
     def __init__(self):
@@ -37,6 +45,9 @@ class QHLine(QFrame):
 # simple gui for math 76 project
 class ColonyUI(QWidget):
 
+    # emitted on the worker thread when a frame is waiting; delivered to showFrame on the GUI thread
+    frameReady = pyqtSignal()
+
     def __init__(self, parameters):
         super().__init__()
         self.params = parameters
@@ -51,7 +62,11 @@ class ColonyUI(QWidget):
         evo_gui.addWidget(self.canvas, 0,  0, 15, 10)
         evo_gui.addLayout(control_box, 0, 10, 12, 6)
 
-        self.canvas.c_start_timer()
+        # no repaint timer: the canvas is redrawn when the worker hands over a changed frame
+        self.frameReady.connect(self.showFrame)
+        worker.on_frame = self.frameReady.emit
+        worker.start()
+
         self.setFixedSize(1050, 450)
         self.window().setLayout(evo_gui)
         self.setWindowTitle("Evolutionary Dynamics of Spatial Games")
@@ -59,6 +74,51 @@ class ColonyUI(QWidget):
         self.show()
 
 
+    '''
+    draws the worker's latest frame: only its changed regions (r0, r1, c0, c1), or the whole grid
+    '''
+    def showFrame(self):
+        frame = worker.take_frame()
+        if frame is None or worker.rewind_to is not None:
+            return      # nothing new, or a rewound state is being shown
+
+        size = self.hive.cell_size
+        if frame.regions is None:
+            draw_colony(self.hive, frame.coop)
+            self.canvas.update(0, 0, self.hive.columns * size, self.hive.rows * size)
+        else:
+            for (r0, r1, c0, c1) in frame.regions:
+                draw_colony_region(self.hive, r0, r1, c0, c1, frame.coop)
+                self.canvas.update(c0 * size, r0 * size, (c1 - c0) * size, (r1 - r0) * size)
+
+        status = "Generation %d" % frame.generation
+        if frame.playing:
+            status += "   %.1f gen/s" % frame.rate
+        self.status.setText(status)
+        self.play.setText("Pause" if worker.playing else "Play")
+
+        self.rewind.blockSignals(True)
+        self.rewind.setRange(0, max(len(history) - 1, 0))
+        self.rewind.setValue(self.rewind.maximum())
+        self.rewind.blockSignals(False)
+
+    '''
+    shows the i-th state of the history without touching the colony; it is rewound to that state
+    (and the later states dropped) when the next generation is computed or a cell is edited
+    '''
+    def rewindMoved(self, i):
+        if i >= len(history):
+            return
+        worker.scrub(i)
+        size = self.hive.cell_size
+        draw_colony(self.hive, history.state(i))
+        self.canvas.update(0, 0, self.hive.columns * size, self.hive.rows * size)
+        self.status.setText("Generation %d (rewound)" % history.generation(i))
+        self.play.setText("Play")
+
+    def closeEvent(self, event):
+        worker.stop()
+
     def initControls(self):
         control_box = QGridLayout()
         row = 0
@@ -89,7 +149,7 @@ class ColonyUI(QWidget):
         t_entry.textChanged[str].connect(self.tChanged)
         t_entry.setToolTip('Minimum number of defector neighbors needed '
                            'for central pixel to defect in next generation'
-                           '\nRange: [0,8]')
+                           '\nRange: [0,8] for an interaction radius of 1')
         t_entry.setToolTipDuration(DURATION)
         control_box.addWidget(QLabel("Threshold ="), row, 0, 1, 2)
         control_box.addWidget(t_entry, row, 2, 1, 1)
@@ -168,12 +228,36 @@ class ColonyUI(QWidget):
         row+=1
 
         weights = QComboBox()
-        functions = ["Uniform", "Inverse Manhattan", "Inverse Euclidean"]
+        functions = list(WEIGHT_FUNCTIONS)
         weights.addItems(functions)
         weights.activated[str].connect(self.weightChanged)
         control_box.addWidget(QLabel("Weighting Function = "), row, 0, 1, 2)
         control_box.addWidget(weights, row, 2, 1, 1)
 
+        row += 1
+
+        # interaction and imitation radii
+        i_rad = QSpinBox(self)
+        i_rad.setRange(1, 10)
+        i_rad.setValue(self.params.interaction_radius)
+        i_rad.valueChanged[int].connect(self.interactionChanged)
+        i_rad.setToolTip('Payoffs (and threshold counts) come from neighbors within this radius\n'
+                         '1 - 3x3 Moore neighborhood <--- DEFAULT')
+        i_rad.setToolTipDuration(DURATION)
+
+        m_rad = QSpinBox(self)
+        m_rad.setRange(1, 10)
+        m_rad.setValue(self.params.imitation_radius)
+        m_rad.valueChanged[int].connect(self.imitationChanged)
+        m_rad.setToolTip('Strategies are copied from neighbors within this radius\n'
+                         '1 - 3x3 Moore neighborhood <--- DEFAULT')
+        m_rad.setToolTipDuration(DURATION)
+
+        control_box.addWidget(QLabel("Interaction radius ="), row, 0, 1, 2)
+        control_box.addWidget(i_rad, row, 2, 1, 1)
+        control_box.addWidget(QLabel("Imitation radius ="), row, 3, 1, 2)
+        control_box.addWidget(m_rad, row, 5, 1, 1)
+
         row += 1
         control_box.addWidget(QHLine(), row, 0, 1, 6)
         row += 1
@@ -198,7 +282,7 @@ class ColonyUI(QWidget):
 
         #add combo box
         presets = QComboBox()
-        ops = ["All Cooperators", "von Neumann", "3x3 Defectors", "5x5 Defectors"]
+        ops = PRESETS
         presets.addItems(ops)
         presets.activated[str].connect(self.presetChosen)
         control_box.addWidget(QLabel("Preset Grid Formation: "), row, 0, 1, 2)
@@ -214,64 +298,121 @@ class ColonyUI(QWidget):
         next_gen.setToolTip('Use the current parameters to compute\n the next generation of the colony')
         next_gen.clicked.connect(next_gen_click)
 
-        control_box.addWidget(next_gen, row, 1, 1, 4)
+        self.play = QPushButton('Play', self)
+        self.play.setToolTip('Keep computing generations until paused')
+        self.play.clicked.connect(self.playClicked)
+
+        control_box.addWidget(next_gen, row, 0, 1, 4)
+        control_box.addWidget(self.play, row, 4, 1, 2)
+        row += 1
+
+        rate = QSpinBox(self)
+        rate.setRange(0, 1000)
+        rate.setValue(0)
+        rate.setSpecialValueText("max")
+        rate.valueChanged[int].connect(self.rateChanged)
+        rate.setToolTip('Generations per second while playing\n'
+                        'max - as fast as possible <--- DEFAULT')
+        rate.setToolTipDuration(DURATION)
+
+        self.status = QLabel("Generation 0", self)
+
+        control_box.addWidget(QLabel("Generations/s ="), row, 0, 1, 2)
+        control_box.addWidget(rate, row, 2, 1, 1)
+        control_box.addWidget(self.status, row, 3, 1, 3)
+        row += 1
+
+        self.rewind = QSlider(Qt.Horizontal, self)
+        self.rewind.setFocusPolicy(Qt.NoFocus)
+        self.rewind.setRange(0, 0)
+        self.rewind.valueChanged[int].connect(self.rewindMoved)
+        self.rewind.setToolTip('Drag back to see earlier generations and edits\n'
+                               'Stepping, playing or editing from there discards the later ones')
+        self.rewind.setToolTipDuration(DURATION)
+
+        control_box.addWidget(QLabel("Rewind ="), row, 0, 1, 2)
+        control_box.addWidget(self.rewind, row, 2, 1, 4)
 
         return control_box
 
+    # the rules read the settings while the worker steps, so they are changed on the worker between generations
+    def setParam(self, name, value):
+        worker.configure(lambda: setattr(self.params, name, value))
+
+    def setPayoff(self, i, value):
+        worker.configure(lambda: self.params.payoff.__setitem__(i, value))
+
     def aChanged(self, text):
         val = line_to_float(text)
         if val != float("-inf"):
-            self.params.payoff[0] = val
+            self.setPayoff(0, val)
             if debug:
-                print(self.params.payoff)
+                print(val)
 
     def bChanged(self, text):
         val = line_to_float(text)
         if val != float("-inf"):
-            self.params.payoff[1] = val
+            self.setPayoff(1, val)
 
     def cChanged(self, text):
         val = line_to_float(text)
         if val != float("-inf"):
-            self.params.payoff[2] = val
+            self.setPayoff(2, val)
 
     def dChanged(self, text):
         val = line_to_float(text)
         if val != float("-inf"):
-            self.params.payoff[3] = val
+            self.setPayoff(3, val)
 
     def tChanged(self, text):
         val = line_to_float(text)
         if val != float("-inf"):
-            self.params.threshold = val # should make sure this is positive, <= # neighbors
+            self.setParam("threshold", val)    # should make sure this is positive, <= # neighbors
             if debug:
-                print(self.params.threshold)
+                print(val)
 
     def stubChanged(self, value):
-        self.params.stubbornness = value / 100.0
+        self.setParam("stubbornness", value / 100.0)
         if debug:
-            print(self.params.stubbornness)
+            print(value / 100.0)
 
     def silChanged(self, value):
-        self.params.silence = value / 100.0
+        self.setParam("silence", value / 100.0)
         if debug:
-            print(self.params.silence)
+            print(value / 100.0)
 
     def weightChanged(self, text):
-        if text == "Inverse Manhattan":
-            self.params.weight_func = inv_manhattan
-        elif text == "Inverse Euclidean":
-            self.params.weight_func = inv_euclidean
-        else:
-            self.params.weight_func = uniform_w
+        self.setParam("weight_func", WEIGHT_FUNCTIONS.get(text, uniform_w))
+        if debug:
+            print(text)
+
+    def interactionChanged(self, value):
+        self.setParam("interaction_radius", value)
         if debug:
-            print(self.params.weight_func)
+            print(value)
+
+    def imitationChanged(self, value):
+        self.setParam("imitation_radius", value)
+        if debug:
+            print(value)
+
+    def playClicked(self):
+        if worker.playing:
+            worker.pause()
+            self.play.setText("Play")
+        else:
+            worker.play()
+            self.play.setText("Pause")
+
+    def rateChanged(self, value):
+        worker.set_rate(value)
 
     def betaChanged(self, value):
-        self.params.beta = value
+        self.setParam("beta", value)
         if debug:
-            print(self.params.beta)
+            print(value)
 
+    # the preset is only read on this thread, by reset_grid()
     def presetChosen(self, text):
         self.params.preset = text
         if debug:
@@ -279,9 +420,9 @@ class ColonyUI(QWidget):
 
     def genFuncChanged(self, b):       # b is selected button
         if (b.isChecked()):
-            self.params.next_gen_type = b.text()
+            self.setParam("next_gen_type", b.text())
             if debug:
-                print(self.params.next_gen_type)
+                print(b.text())
 
 def line_to_float(text):
     frac = str(text).split("/")
@@ -305,20 +446,9 @@ def line_to_float(text):
 
 ## Graphics / UI interactions
 def next_gen_click():
-    if hive.settings.next_gen_type == "Threshold":
-        hive.next_generation_threshold()
-        if debug:
-            print("Updated via Simple Thresholding")
-    elif hive.settings.next_gen_type == "Perfect Best Response":
-        hive.next_generation_best_response(hive.settings.weight_func)
-        if debug:
-            print("Updated via Perfect Best Response")
-    elif hive.settings.next_gen_type == "Irrational Best Response":
-        hive.irrational_best_response(hive.settings.weight_func)
-        if debug:
-            print("Updated via Irrational Best Response")
-    else:
-        print("Unrecognized update function. Please select another from the drop down.")
+    worker.step()
+    if debug:
+        print("Updating via " + hive.settings.next_gen_type)
     print(hive.settings)
 
 
@@ -327,28 +457,21 @@ def click(mx, my):
     row = int(floor(my / hive.cell_size))
 
     if (0 <= col < hive.columns) and (0 <= row < hive.rows):
-        hive.cell(row, col).flip()
+        worker.submit(hive.cell(row, col).flip)
 
 
 def reset_grid():
     r = 12
     c = 10
-    ["All Cooperators", "von Neumann", "3x3 Defectors", "5x5 Defectors"]
-    if hive.settings.preset == "All Cooperators":
-        hive.preset_all_blue()
-    elif hive.settings.preset == "von Neumann":
-        hive.preset_vonNeumann(r, c)
-    elif hive.settings.preset == "3x3 Defectors":
-        hive.preset_3x3(r, c)
-    elif hive.settings.preset == "5x5 Defectors":
-        hive.preset_5x5(r, c)
-    else:
-        pass
+    if hive.settings.preset in PRESETS:
+        preset = hive.settings.preset
+        worker.submit(lambda: hive.apply_preset(preset, r, c))
 
 
 def draw():
-    hive.draw()
+    draw_colony(hive)
 
 if __name__ == '__main__':
+    app = get_app()
     ex = ColonyUI(settings)
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,70 @@
+# Active-region tracking for the Colony
+# The grid is cut into square tiles; a tile is dirty when one of its cells changed strategy last generation.
+# Under a deterministic rule a cell can only change if something within the rule's reach (its halo) changed,
+# so only dirty tiles plus that halo need to be recomputed.
+
+import numpy as np
+
+TILE = 32
+
+# fall back to a full sweep when more than this fraction of the tiles would have to be recomputed
+MAX_ACTIVE_FRACTION = 0.3
+
+class ActiveTiles:
+    def __init__(self, rows, columns, tile=TILE):
+        self.rows = rows
+        self.columns = columns
+        self.tile = tile
+        self.shape = (-(-rows // tile), -(-columns // tile))
+
+        self.dirty = np.ones(self.shape, dtype=bool)        # everything is live at the start
+
+    # the cell at r, c was changed from outside the update rules
+    def mark(self, r, c):
+        self.dirty[(r % self.rows) // self.tile, (c % self.columns) // self.tile] = True
+
+    def mark_all(self):
+        self.dirty[:] = True
+
+    '''
+    records the cells that changed strategy in the last generation
+    flipped - flat indices (r * columns + c) of the changed cells
+    '''
+    def record(self, flipped):
+        self.dirty[:] = False
+        self.dirty[(flipped // self.columns) // self.tile, (flipped % self.columns) // self.tile] = True
+
+    # number of tiles needed to cover halo cells along an axis, allowing for a short last tile
+    def reach(self, halo, cells):
+        smallest = min(self.tile, cells - (-(-cells // self.tile) - 1) * self.tile)
+        return -(-halo // smallest)
+
+    '''
+    tiles whose cells may change next generation: the dirty tiles grown by halo cells on the torus
+    Returns None when so much of the grid is live that a full sweep is cheaper
+    '''
+    def live(self, halo):
+        reach_r = self.reach(halo, self.rows)
+        reach_c = self.reach(halo, self.columns)
+
+        rows_grown = self.dirty.copy()
+        for dr in range(1, reach_r + 1):
+            rows_grown |= np.roll(self.dirty, dr, axis=0) | np.roll(self.dirty, -dr, axis=0)
+        live = rows_grown.copy()
+        for dc in range(1, reach_c + 1):
+            live |= np.roll(rows_grown, dc, axis=1) | np.roll(rows_grown, -dc, axis=1)
+
+        if np.count_nonzero(live) > MAX_ACTIVE_FRACTION * live.size:
+            return None
+        return live
+
+    '''
+    horizontal runs of consecutive live tiles, as cell ranges (r0, r1, c0, c1)
+    '''
+    def runs(self, live):
+        for tr in range(self.shape[0]):
+            row = np.concatenate(([False], live[tr], [False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+            for start, stop in zip(edges[::2], edges[1::2]):
+                yield (tr * self.tile, min((tr + 1) * self.tile, self.rows),
+                       int(start) * self.tile, min(int(stop) * self.tile, self.columns))
@@ -0,0 +1,389 @@
+# Asynchronous updates of a Colony: one cell at a time instead of the whole grid at once
+# Every cell revises its strategy at rate 1, so one unit of time (one generation of Colony.next_generation)
+# holds as many single-cell updates as there are cells, and runs are compared with synchronous runs at equal
+# physical time. An update applies the colony's rule to that one cell, from the neighbor counts or payoffs
+# of the moment; a flip only changes the counts and payoffs within the interaction radius, which are kept up
+# to date locally. The counts are integers, one per distinct weight of the kernel, so payoffs never drift:
+# cells with the same neighborhood always get the same payoff and exact ties stay ties, as with
+# fft_level_sum in the synchronous rules. Two schedules:
+#   Random Sequential - N randomly chosen cells per unit of time, in order. Updates of cells further apart
+#                       than the rule's reach do not interact, so the sequence is run in vectorized rounds of
+#                       updates that no earlier pending update is within reach of; the result is the same as
+#                       updating the cells one by one. While few cells are unstable, only the updates that
+#                       land on one of them are drawn, as events.
+#   Gillespie         - continuous time, rejection-free: only cells whose update would switch them (non-zero
+#                       switch rate) are kept, an event picks one of them with probability proportional to
+#                       its rate, and time advances by an exponential waiting time. Best when few cells are
+#                       unstable. Rates below the largest possible one (Fermi rule) are drawn by thinning.
+# Cost: every update gathers its cell's neighborhood, so a unit of time with many unstable cells costs about
+# 10 to 40 times a synchronous generation (e.g. 256x256 on one core: threshold 0.02 s, perfect best response
+# 0.08 s, against 0.001 s and 0.006 s; 1024x1024 threshold about 1 s against 0.02 s). As the grid settles,
+# the events cost about as little as the synchronous rules' sparse updates (about 0.1 ms at 256x256).
+# Silence is redrawn once per unit of time, like once per synchronous generation, from the same streams.
+# Stubbornness is the probability that an update keeps the current strategy; the threshold rule ignores
+# silence and stubbornness, as in the synchronous rules.
+
+import numpy as np
+from neighborhood import *
+from weighting_functions import weight_kernel
+from timing import phase_timer
+
+SCHEDULES = ["Random Sequential", "Gillespie"]
+SCHEDULE_ALIASES = {"sequential": "Random Sequential",
+                    "gillespie": "Gillespie"}
+
+# the events of a generation come from this draw of colony.streams (draw 0 is the silence map)
+EVENT_DRAW = 1
+
+# cells per block when a whole grid of decisions or rates is computed
+BLOCK = 2 ** 16
+
+# random sequential attempts are sorted into rounds a chunk at a time, at most this fraction of the cells
+# per chunk (denser chunks make longer chains of attempts waiting on each other) and at most CHUNK
+CHUNK_FRACTION = 1 / 16
+CHUNK = 2 ** 16
+
+# owner of a cell that no attempt is waiting at
+NOBODY = np.iinfo(np.int64).max
+
+# units of time that start with more than this fraction of unstable cells run as attempts, see events()
+MAX_EVENT_FRACTION = 0.02
+
+'''
+Updates a Colony asynchronously with one of SCHEDULES
+Attaching sets colony.stepper, so colony.next_generation() advances one unit of time until close(), e.g.
+    with AsyncScheduler(hive, "Gillespie"):
+        for g in hive.generations(100): ...
+After a generation, colony.flipped holds the cells whose strategy differs from the previous generation.
+'''
+class AsyncScheduler:
+    def __init__(self, colony, schedule="Random Sequential"):
+        if schedule not in SCHEDULES:
+            raise ValueError("Unrecognized schedule: " + str(schedule))
+        self.colony = colony
+        self.schedule = schedule
+        self.rows = colony.rows
+        self.columns = colony.columns
+        self.cells = self.rows * self.columns
+
+        self.key = None             # settings the neighbor fields were built for
+        self.stale = True           # the grid was edited from outside since the fields were built
+        self.stepping = False
+        self.owner = np.full(self.cells, NOBODY, dtype=np.int64)   # see attempts()
+        self.last_flips = 0                                         # cells flipped by the last unit of time
+        self.index = None                                           # see steps()
+        self.index_margin = None
+
+        colony.add_listener(self.colony_changed)
+        colony.stepper = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # stops updating the colony; its next synchronous generation recomputes every cell
+    def close(self):
+        if self.colony.stepper is self:
+            self.colony.stepper = None
+        if self.colony_changed in self.colony.listeners:
+            self.colony.listeners.remove(self.colony_changed)
+        self.colony.rule_key = None
+        self.colony.active.mark_all()
+
+    # colony listener: any change that is not ours means the fields have to be rebuilt
+    def colony_changed(self, region):
+        if not self.stepping:
+            self.stale = True
+
+    '''
+    flat indices of the cells at the given offsets from every cell of x, shape (len(x), len(offsets))
+    offsets - positions in the padded index grid relative to a cell, see steps()
+    '''
+    def neighbors(self, x, offsets):
+        return self.index[self.base[x][:, None] + offsets]
+
+    '''
+    sets up the grid of flat cell indices wrapped around the torus with a margin of the rule's reach, in which
+    the neighbors at any offset of a cell are one addition away; returns the (dr, dc) offsets as such steps
+    '''
+    def steps(self, *offsets):
+        width = self.columns + 2 * self.reach
+        if self.index is None or self.index_margin != self.reach:
+            grid = np.arange(self.cells, dtype=np.int64).reshape(self.rows, self.columns)
+            self.index = np.pad(grid, self.reach, mode="wrap").reshape(-1)
+            self.index_margin = self.reach
+            self.base = ((grid // self.columns + self.reach) * width
+                         + grid % self.columns + self.reach).reshape(-1)
+        return [np.asarray(o)[:, 0] * width + np.asarray(o)[:, 1] for o in offsets]
+
+    '''
+    rebuilds the rule's parameters and neighbor fields from the colony's settings and grid, and draws the
+    silence map of the generation
+    '''
+    def prepare(self):
+        colony = self.colony
+        settings = colony.settings
+        self.rule = settings.next_gen_type
+        if self.rule not in ("Threshold", "Perfect Best Response", "Irrational Best Response"):
+            raise ValueError("Unrecognized update function: " + str(self.rule))
+
+        self.coop = colony.coop.reshape(-1)       # a view: updates go straight into the colony
+        radius = settings.interaction_radius
+        if self.rule == "Threshold":
+            self.stubbornness = 0.0
+            self.silence = 0.0
+            self.reach = radius
+            taps = square_offsets(radius)
+            self.tap_offsets = np.array(taps).reshape(-1, 2)
+        else:
+            self.stubbornness = settings.stubbornness
+            self.silence = settings.silence
+            self.reach = radius + settings.imitation_radius
+            kernel = weight_kernel(settings.weight_func, radius)
+            taps = np.argwhere(kernel != 0)
+            self.tap_offsets = taps - radius
+            # every tap's weight as an index into the distinct weights, which are counted separately
+            self.levels, self.tap_level = np.unique(kernel[taps[:, 0], taps[:, 1]], return_inverse=True)
+            self.payoff = list(settings.payoff)
+            self.beta = settings.beta
+            imitation = np.array(square_offsets(settings.imitation_radius))
+            self.imitation, self.imitation_self = self.steps(imitation, np.vstack(([(0, 0)], imitation)))
+        reach = [(dr, dc) for dr in range(-self.reach, self.reach + 1) for dc in range(-self.reach, self.reach + 1)]
+        self.reach_offsets, self.sources = self.steps(reach, -self.tap_offsets)
+
+        key = (self.rule, settings.threshold, tuple(settings.payoff), settings.weight_func, radius,
+               settings.imitation_radius, self.stubbornness, self.silence, settings.beta, colony.coop.shape)
+        if key == self.key and not self.stale and self.silence == 0:
+            return
+        self.key = key
+        self.stale = False
+
+        if self.silence != 0:
+            colony.silent = colony.streams.at(colony.generation).random((self.rows, self.columns)) <= self.silence
+        else:
+            colony.silent = np.zeros((self.rows, self.columns), dtype=bool)
+        self.silent = colony.silent.reshape(-1)
+
+        # threshold: defecting neighbors of every cell; best response: heard cooperators and defectors of every
+        # cell at each distinct weight, integers so that they stay exact, and the payoffs they give
+        coop = colony.coop
+        if self.rule == "Threshold":
+            self.defectors = count_neighbors(~coop, radius).reshape(-1).astype(np.int64)
+        else:
+            self.coop_counts = np.empty((len(self.levels), self.cells), dtype=np.int64)
+            self.defect_counts = np.empty((len(self.levels), self.cells), dtype=np.int64)
+            for level, weight in enumerate(self.levels):
+                taps = (kernel == weight).astype(float)
+                self.coop_counts[level] = np.rint(neighbor_sum(coop & ~colony.silent, taps)).reshape(-1)
+                self.defect_counts[level] = np.rint(neighbor_sum(~coop & ~colony.silent, taps)).reshape(-1)
+            self.p = np.empty(self.cells)
+            for s in range(0, self.cells, BLOCK):
+                x = np.arange(s, min(s + BLOCK, self.cells))
+                self.p[x] = self.payoffs(x)
+        self.rates = None
+
+    '''
+    payoffs of the cells x from their neighbor counts, combined weight by weight as in fft_level_sum, so cells
+    with the same neighborhood get bit-for-bit the same payoff however often their neighbors have flipped
+    '''
+    def payoffs(self, x):
+        w_coop = np.zeros(len(x))
+        w_defect = np.zeros(len(x))
+        for level, weight in enumerate(self.levels):
+            w_coop += weight * self.coop_counts[level, x]
+            w_defect += weight * self.defect_counts[level, x]
+        p = self.payoff
+        return np.where(self.coop[x], p[0] * w_coop + p[1] * w_defect, p[2] * w_coop + p[3] * w_defect)
+
+    '''
+    strategies the deterministic part of the rule gives the cells x (threshold, perfect best response)
+    '''
+    def decide(self, x):
+        if self.rule == "Threshold":
+            return self.defectors[x] < self.colony.settings.threshold
+
+        # best payoff among cooperators and among defectors within the imitation radius (and the cell itself)
+        around = self.neighbors(x, self.imitation_self)
+        p = self.p[around]
+        coop = self.coop[around]
+        best_coop = np.where(coop, p, -np.inf).max(axis=1)
+        best_defect = np.where(coop, -np.inf, p).max(axis=1)
+        return np.where(self.coop[x], best_coop >= best_defect, best_coop > best_defect)
+
+    '''
+    Fermi rule terms of the cells x: for every neighbor within the imitation radius, the probability of
+    adopting its strategy if it is the one compared with, zero when that would change nothing
+    returns (neighbors, probabilities), both of shape (len(x), neighbors per cell)
+    '''
+    def fermi_terms(self, x):
+        around = self.neighbors(x, self.imitation)
+        gain = self.p[around] - self.p[x][:, None]
+        adopt = 0.5 * (1.0 + np.tanh(0.5 * self.beta * gain))
+        adopt[self.silent[around] | (self.coop[around] == self.coop[x][:, None])] = 0.0
+        return around, adopt
+
+    # rate at which each of the cells x switches strategy
+    def switch_rates(self, x):
+        keep = 1.0 - self.stubbornness
+        if self.rule == "Irrational Best Response":
+            return keep * self.fermi_terms(x)[1].mean(axis=1)
+        return keep * (self.decide(x) != self.coop[x])
+
+    '''
+    flips the cells f (all different) and updates the neighbor fields around them, and the payoffs of every
+    cell whose counts or strategy changed
+    '''
+    def flip(self, f):
+        self.coop[f] = ~self.coop[f]
+        # a flipped cell is the neighbor at offset o of the cells f - o
+        around = self.neighbors(f, self.sources)
+        if self.rule == "Threshold":
+            np.add.at(self.defectors, around, np.where(self.coop[f], -1, 1)[:, None])
+            return
+        heard = ~self.silent[f]
+        sign = np.where(self.coop[f[heard]], 1, -1)[:, None]
+        counted = self.tap_level * self.cells + around[heard]
+        np.add.at(self.coop_counts.reshape(-1), counted, sign)
+        np.add.at(self.defect_counts.reshape(-1), counted, -sign)
+        changed = np.concatenate((f, around[heard].reshape(-1)))        # repeated cells get the same payoff
+        self.p[changed] = self.payoffs(changed)
+
+    '''
+    applies random single-cell updates (attempts) to the cells x, which are all more than the rule's reach
+    apart; events - positions of the attempts in the draws of the generation
+    '''
+    def attempt(self, x, events):
+        if self.rule == "Irrational Best Response":
+            around, adopt = self.fermi_terms(x)
+            switch = self.q[events] < adopt[np.arange(len(x)), self.pick[events]]
+        else:
+            switch = self.decide(x) != self.coop[x]
+        if self.keep is not None:
+            switch &= ~self.keep[events]
+        self.flip(x[switch])
+
+    '''
+    n random single-cell updates in a row, with the same result as one at a time
+    The sequence is cut into chunks; within a chunk, every round applies at once the attempts that no earlier
+    attempt still waiting is within reach of. Those cannot affect each other, and every attempt still comes
+    after the earlier ones it depends on.
+    '''
+    def attempts(self, rng, n):
+        cells = rng.integers(self.cells, size=n)
+        self.keep = rng.random(n) < self.stubbornness if self.stubbornness else None
+        if self.rule == "Irrational Best Response":
+            self.pick = rng.integers(len(self.imitation), size=n)
+            self.q = rng.random(n)
+
+        size = max(1, min(CHUNK, int(self.cells * CHUNK_FRACTION)))
+        for start in range(0, n, size):
+            chunk = cells[start:start + size]
+            around = self.neighbors(chunk, self.reach_offsets)
+            waiting = np.arange(len(chunk))
+            while len(waiting):
+                # earliest waiting attempt at every cell, then at every attempt's surroundings
+                np.minimum.at(self.owner, chunk[waiting], waiting)
+                ready = self.owner[around[waiting]].min(axis=1) == waiting
+                self.owner[chunk[waiting]] = NOBODY
+                self.attempt(chunk[waiting[ready]], start + waiting[ready])
+                waiting = waiting[~ready]
+
+    '''
+    one unit of time of the schedule as events at the cells with a non-zero switch rate: the attempts that
+    find a cell unstable (random sequential) or the Gillespie events
+    While many cells are unstable, events one at a time cost more than trying every cell: the unit then runs
+    as attempts at random cells, N of them (random sequential) or a Poisson number with mean N (Gillespie,
+    the same continuous-time process seen through its clock ticks). A unit that follows one with many flips
+    does so without computing the rates first.
+    '''
+    def events(self, rng):
+        top = 1.0 - self.stubbornness           # largest possible switch rate
+        if top <= 0:
+            return
+        sequential = self.schedule == "Random Sequential"
+        busy = self.rates is None and self.last_flips > MAX_EVENT_FRACTION * self.cells
+        if not busy:
+            if self.rates is None:
+                self.rates = np.concatenate([self.switch_rates(np.arange(s, min(s + BLOCK, self.cells)))
+                                             for s in range(0, self.cells, BLOCK)])
+                self.active = np.flatnonzero(self.rates > 0)
+                self.position = np.full(self.cells, -1, dtype=np.int64)
+                self.position[self.active] = np.arange(len(self.active))
+                self.count = len(self.active)
+                self.active = np.concatenate((self.active, np.zeros(self.cells - self.count, dtype=np.int64)))
+            busy = self.count > MAX_EVENT_FRACTION * self.cells
+        if busy:
+            self.attempts(rng, self.cells if sequential else rng.poisson(self.cells))
+            self.rates = None
+            return
+
+        clock = 0.0         # attempts made (random sequential) or time (Gillespie)
+        while self.count:
+            if sequential:
+                # attempts at stable cells change nothing: skip to the next one at an unstable cell, which
+                # switches it with probability its rate
+                clock += rng.geometric(self.count / self.cells)
+                if clock > self.cells:
+                    break
+                k = self.active[rng.integers(self.count)]
+                if rng.random() >= self.rates[k]:
+                    continue
+            else:
+                clock += rng.exponential(1.0 / (self.count * top))
+                if clock >= 1.0:
+                    break
+                k = self.active[rng.integers(self.count)]
+                if self.rates[k] < top and rng.random() * top >= self.rates[k]:
+                    continue        # thinned out: this cell switches at less than the top rate
+            # switching is adopting the other strategy, whichever neighbor (Fermi rule) it came from
+            self.flip(np.array([k]))
+            self.update_rates(self.neighbors(np.array([k]), self.reach_offsets)[0])
+
+    # recomputes the switch rates of the cells x and keeps the list of active cells in step
+    def update_rates(self, x):
+        x = np.unique(x)
+        rates = self.switch_rates(x)
+        self.rates[x] = rates
+        for cell, active in zip(x.tolist(), (rates > 0).tolist()):
+            i = self.position[cell]
+            if active and i < 0:
+                self.active[self.count] = cell
+                self.position[cell] = self.count
+                self.count += 1
+            elif not active and i >= 0:
+                last = self.active[self.count - 1]
+                self.active[i] = last
+                self.position[last] = i
+                self.position[cell] = -1
+                self.count -= 1
+
+    '''
+    advances the colony by one unit of time; Colony.next_generation calls this and counts the generation
+    '''
+    def step(self):
+        colony = self.colony
+        lap = phase_timer.start()
+        self.prepare()
+        start = colony.coop.copy()
+        lap.lap("fields")
+
+        rng = colony.streams.generator(colony.generation, EVENT_DRAW)
+        self.stepping = True
+        try:
+            self.events(rng)
+        finally:
+            self.stepping = False
+        lap.lap("events")
+
+        colony.flipped = np.flatnonzero(colony.coop != start)
+        self.last_flips = len(colony.flipped)
+        colony.rule_key = None
+        colony.active.record(colony.flipped)
+        colony.count_flips()
+        if len(colony.flipped):
+            self.stepping = True
+            colony.notify()
+            self.stepping = False
+        lap.lap("commit")
@@ -0,0 +1,183 @@
+# Benchmarks of the Colony update rules
+# Every case (rule x weighting function x grid size x with/without silence and stubbornness) starts from the
+# same seeded random grid and runs a fixed number of generations that depends only on the grid size, so every
+# version of the code does the same work (deterministic rules settle down, and later generations are cheaper
+# than the first ones). The run is repeated and the fastest repetition counts. Generations per second,
+# cell-updates per second and peak memory go to a JSON file; --compare flags cases that got slower than
+# a previous file, e.g.
+#   python benchmark.py --out before.json
+#   python benchmark.py --out after.json --compare before.json
+# The threshold rule ignores the weighting function, silence and stubbornness, so it has one case per size.
+# --workers N steps every case in N processes (parallel.py); those cases get their own keys.
+
+import argparse
+import datetime
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from colony import *
+from colonyParams import *
+from parallel import *
+from weighting_functions import *
+
+SIZES = [20, 256, 1024, 4096]
+SEED = 76
+DEFECT_FRACTION = 0.3
+
+# generations per run: about CELL_UPDATES cell updates, within these limits
+CELL_UPDATES = 2 * 10 ** 7
+MIN_GENERATIONS = 3
+MAX_GENERATIONS = 1000
+
+# silence and stubbornness of the noisy cases
+NOISE = {"silence": 0.1, "stubbornness": 0.1}
+
+'''
+every benchmark case, as a dictionary of rule, weight, noise and size
+'''
+def cases(rules, weights, sizes, noise):
+    for size in sizes:
+        for rule in rules:
+            if rule == "Threshold":
+                yield {"rule": rule, "weight": None, "noise": False, "size": size}
+                continue
+            for weight, noisy in itertools.product(weights, noise):
+                yield {"rule": rule, "weight": weight, "noise": noisy, "size": size}
+
+# stable text key of a case, used to match cases between result files
+def case_key(case, workers=None):
+    key = "%s|%s|%s|%d" % (case["rule"], case["weight"], "noise" if case["noise"] else "clean", case["size"])
+    return key if workers is None else key + "|w%d" % workers
+
+def case_generations(case, scale=1.0):
+    n = int(scale * CELL_UPDATES / (case["size"] * case["size"]))
+    return min(max(n, MIN_GENERATIONS), MAX_GENERATIONS)
+
+def case_colony(case):
+    settings = ColonyParams()
+    settings.next_gen_type = case["rule"]
+    settings.weight_func = WEIGHT_FUNCTIONS[case["weight"] or "Uniform"]
+    settings.seed = SEED
+    if case["noise"]:
+        settings.update(NOISE)
+    else:
+        settings.update({"silence": 0, "stubbornness": 0})
+
+    size = case["size"]
+    hive = Colony(size, size, 1, settings)
+    hive.coop = hive.rng.random((size, size)) >= DEFECT_FRACTION
+    return hive
+
+'''
+runs the case repeat times from its seeded start and keeps the fastest time, which also leaves out the
+first run's cache warm-up; peak memory is then measured over a few serial generations with tracemalloc
+'''
+def run_case(case, generations, repeat, workers=None):
+    best = None
+    for r in range(repeat):
+        hive = case_colony(case)
+        stepper = None if workers is None else ParallelStepper(hive, workers)
+        start = time.perf_counter()
+        for g in range(generations):
+            hive.next_generation()
+        elapsed = time.perf_counter() - start
+        if stepper:
+            stepper.close()
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # peak memory of a fresh colony and its first generations, the colony's own arrays included
+    tracemalloc.start()
+    hive = case_colony(case)
+    for g in range(min(generations, MIN_GENERATIONS)):
+        hive.next_generation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    cells = case["size"] * case["size"]
+    result = dict(case)
+    result.update({"key": case_key(case, workers),
+                   "workers": workers,
+                   "generations": generations,
+                   "seconds": best,
+                   "generations_per_s": generations / best,
+                   "cell_updates_per_s": generations * cells / best,
+                   "peak_bytes": peak})
+    return result
+
+def environment():
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "seed": SEED,
+            "argv": sys.argv[1:]}
+
+'''
+cases of results that are slower than in baseline by more than tolerance (a fraction)
+returns a list of (key, baseline gen/s, new gen/s)
+'''
+def regressions(results, baseline, tolerance):
+    before = {r["key"]: r for r in baseline["results"]}
+    slower = []
+    for r in results["results"]:
+        old = before.get(r["key"])
+        if old and old["generations"] == r["generations"] and r["generations_per_s"] < old["generations_per_s"] * (1 - tolerance):
+            slower.append((r["key"], old["generations_per_s"], r["generations_per_s"]))
+    return slower
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the Colony update rules")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="grid sizes (square grids)")
+    parser.add_argument("--rules", nargs="+", choices=list(RULE_ALIASES) + UPDATE_RULES, default=UPDATE_RULES)
+    parser.add_argument("--weights", nargs="+", choices=list(WEIGHT_FUNCTIONS), default=list(WEIGHT_FUNCTIONS))
+    parser.add_argument("--noise", choices=["both", "clean", "noisy"], default="both",
+                        help="run the best response rules without and/or with silence and stubbornness")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest one counts")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply the number of generations per case (results are only comparable "
+                             "between runs with the same scale)")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="step every case in N processes (0 for one per core) instead of serially")
+    parser.add_argument("--out", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="flag cases more than this fraction slower than the baseline")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rules = [RULE_ALIASES.get(rule, rule) for rule in args.rules]
+    noise = {"both": [False, True], "clean": [False], "noisy": [True]}[args.noise]
+
+    results = {"environment": environment(), "results": []}
+    print("%-48s %8s %12s %14s %10s" % ("case", "gens", "gen/s", "cell-upd/s", "peak MB"))
+    for case in cases(rules, args.weights, args.sizes, noise):
+        r = run_case(case, case_generations(case, args.scale), args.repeat, args.workers)
+        results["results"].append(r)
+        print("%-48s %8d %12.2f %14.3g %10.1f" % (r["key"], r["generations"], r["generations_per_s"],
+                                                  r["cell_updates_per_s"], r["peak_bytes"] / 2 ** 20))
+        sys.stdout.flush()
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+    print("results written to " + args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline, args.tolerance)
+        for key, old, new in slower:
+            print("SLOWER  %-48s %.2f -> %.2f gen/s (%+.1f%%)" % (key, old, new, 100 * (new / old - 1)))
+        if slower:
+            return 1
+        print("no case is more than %d%% slower than %s" % (100 * args.tolerance, args.compare))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,10 +14,11 @@ from PyQt5.QtWidgets import QApplication, QWidget
 # library version number
 __version__ = "3.0.7pyqt"
 
-print("Imported canvas, version " + __version__)
-
 debug = False
 
+if debug:
+    print("Imported canvas, version " + __version__)
+
 # hint to window manager where to place graphics window
 WINDOW_X = 300
 WINDOW_Y = 300
@@ -26,7 +27,14 @@ WINDOW_Y = 300
 canvas = None
 
 # main app is global to allow things like timers to be started before/without graphics loop
-app = QApplication(sys.argv)
+# it is only created on first use, so importing this module does not start Qt
+app = None
+
+def get_app():
+    global app
+    if app is None:
+        app = QApplication.instance() or QApplication(sys.argv)
+    return app
 
 # used for noop callbacks
 def noop(*args, **kwargs):
@@ -143,7 +151,8 @@ class CS1Canvas(QWidget):
 
         screen_painter = QPainter(self)
 
-        screen_painter.drawImage(0, 0, self.image)
+        # only the part that was invalidated by update(rect)
+        screen_painter.drawImage(event.rect(), self.image, event.rect())
 
         screen_painter.end()
 
@@ -152,7 +161,8 @@ class CS1Canvas(QWidget):
         # qt unhappy if a reference to ipainter is still hanging
         #   around on close
 
-        self.timer.stop()
+        if self.timer:
+            self.timer.stop()
 
         self.ipainter = None
 
@@ -593,6 +603,7 @@ def set_canvas(draw_func=noop, data=None, framerate=40,
                 key_press=noop, key_release=noop):
 
     global canvas
+    get_app()
     canvas = CS1Canvas(draw_fn=draw_func, data=data, window_x=WINDOW_X, window_y=WINDOW_Y,
                        width=width, height=height, title=title, framerate=framerate,
                        mouse_press=mouse_press, mouse_release=mouse_release, mouse_move=mouse_move,
@@ -602,5 +613,5 @@ def set_canvas(draw_func=noop, data=None, framerate=40,
 
 def canvas_quit():
     print("canvas_quit called")
-    app.quit()
+    get_app().quit()
     exit()
\ No newline at end of file
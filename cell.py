@@ -4,15 +4,46 @@
 # Winter 2017, CS76: Evolutionary Game Dynamics
 # Final Project
 
-from canvas import *
-
+'''
+Lightweight view of a single position in a Colony
+The strategy and silence values live in the colony's arrays; pixel coordinates are derived on demand
+'''
 class Cell:
-    def __init__(self, x, y, cell_size):
-        self.coop = True
-        self.x = x
-        self.y = y
-        self.size = cell_size
-        self.silent = False                 # for use in the opt out via silence option
+    __slots__ = ("colony", "r", "c")
+
+    def __init__(self, colony, r, c):
+        self.colony = colony
+        self.r = r
+        self.c = c
+
+    @property
+    def coop(self):
+        return bool(self.colony.coop[self.r, self.c])
+
+    @coop.setter
+    def coop(self, value):
+        self.colony.coop[self.r, self.c] = value
+        self.colony.cell_changed(self.r, self.c)
+
+    @property
+    def silent(self):               # for use in the opt out via silence option
+        return bool(self.colony.silent[self.r, self.c])
+
+    @silent.setter
+    def silent(self, value):
+        self.colony.silent[self.r, self.c] = value
+
+    @property
+    def x(self):
+        return self.c * self.colony.cell_size
+
+    @property
+    def y(self):
+        return self.r * self.colony.cell_size
+
+    @property
+    def size(self):
+        return self.colony.cell_size
 
     def defect(self):
         self.coop = False
@@ -22,10 +53,3 @@ class Cell:
 
     def flip(self):
         self.coop = not self.coop
-
-    def draw(self, c, d):
-        set_fill_color(d[0], d[1], d[2])
-        if self.coop:
-            set_fill_color(c[0], c[1], c[2])
-
-        draw_rectangle(self.x, self.y, self.size, self.size)
\ No newline at end of file
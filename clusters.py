@@ -0,0 +1,342 @@
+# Connected clusters of cooperators and defectors on the torus
+# The grid is cut into tiles. Every tile keeps its own labels of the connected pieces of each strategy inside
+# it; after a generation only the tiles around flipped cells are relabeled. Pieces that touch a tile border
+# are joined across the borders (including the wrap-around) by the links between pieces of neighboring tiles,
+# while pieces that stay inside their tile are whole clusters, kept in a running histogram of sizes.
+# The links and the table of joined clusters are kept between generations: only the links of relabeled tiles
+# are rebuilt, and only the clusters through those tiles are joined again. The cost of an update is the
+# relabeled tiles and the clusters through them, not the whole grid.
+
+from collections import namedtuple
+
+import numpy as np
+
+CLUSTER_TILE = 64
+
+OUTSIDE = 2     # strategy value of the padding around tiles at the grid edge
+
+'''
+clusters of one strategy
+histogram - number of clusters with sizes in [2^b, 2^(b+1)) for every b
+perimeter - cell edges between the strategy's clusters and the other strategy
+'''
+StrategyClusters = namedtuple("StrategyClusters", ["count", "largest", "mean_size", "perimeter", "histogram"])
+ClusterStats = namedtuple("ClusterStats", ["generation", "coop", "defect"])
+
+# neighbor offsets within the connectivity, only half of them (the other half are the same pairs reversed)
+HALF_NEIGHBORS = {4: [(0, 1), (1, 0)], 8: [(0, 1), (1, 0), (1, 1), (1, -1)]}
+
+'''
+labels the connected pieces of every (tile) image in a stack, without wrapping: every cell gets the
+flat index (into the stack) of the smallest cell of its piece; cells equal to OUTSIDE are left alone
+The cells are first grouped into horizontal runs of one strategy, so the union-find only has to join runs
+'''
+def label_tiles(tiles, connectivity=4):
+    k, h, w = tiles.shape
+    cells = tiles.reshape(-1)
+
+    # runs: a new one starts at every cell that differs from its left neighbor, and at the start of every row
+    starts = np.ones((k, h, w), dtype=bool)
+    starts[:, :, 1:] = tiles[:, :, 1:] != tiles[:, :, :-1]
+    run = np.cumsum(starts.reshape(-1), dtype=np.int64).reshape(k, h, w) - 1
+    first_cell = np.flatnonzero(starts)
+
+    # links between the runs of vertically (and diagonally) neighboring cells of the same strategy,
+    # one per change of either run along the row
+    a, b = [], []
+    for (dr, dc) in HALF_NEIGHBORS[connectivity]:
+        if dr == 0:
+            continue
+        here = (slice(None), slice(0, h - dr), slice(max(0, -dc), w - max(0, dc)))
+        near = (slice(None), slice(dr, h), slice(max(0, dc), w - max(0, -dc)))
+        same = (tiles[here] == tiles[near]) & (tiles[here] != OUTSIDE)
+        ra, rb = run[here], run[near]
+        same[:, :, 1:] &= (ra[:, :, 1:] != ra[:, :, :-1]) | (rb[:, :, 1:] != rb[:, :, :-1]) | ~same[:, :, :-1]
+        a.append(ra[same])
+        b.append(rb[same])
+
+    roots = union_roots(len(first_cell), np.concatenate(a), np.concatenate(b))
+    return first_cell[roots][run]
+
+'''
+roots of a union-find over nodes 0..n-1 joined by the edges (a[i], b[i]), every node pointing at the
+smallest node of its component
+Every round hooks each root onto the smallest root it is linked to and then shortcuts every node to its
+root; edges whose ends already share a root are dropped
+'''
+def union_roots(n, a, b):
+    parent = np.arange(n, dtype=np.int64)
+    while len(a):
+        ra = parent[a]
+        rb = parent[b]
+        joined = ra != rb
+        if not joined.any():
+            break
+        a, b, ra, rb = a[joined], b[joined], ra[joined], rb[joined]
+        np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+        # shortcut every node to its root
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return parent
+
+'''
+Keeps the clusters of a Colony up to date from the cells that flipped each generation
+Call update() after every colony.next_generation(); a skipped generation relabels every tile, and edits
+made outside the update rules need refresh()
+connectivity - 4 (edges only, the default) or 8 (corners too)
+'''
+class ClusterAnalyzer:
+    def __init__(self, colony, connectivity=4, tile=CLUSTER_TILE):
+        if connectivity not in HALF_NEIGHBORS:
+            raise ValueError("Connectivity must be 4 or 8, not " + str(connectivity))
+        self.colony = colony
+        self.rows = colony.rows
+        self.columns = colony.columns
+        self.connectivity = connectivity
+        self.tile = min(tile, max(self.rows, self.columns))
+        self.shape = (-(-self.rows // self.tile), -(-self.columns // self.tile))
+        self.cells = self.tile * self.tile
+
+        # per-piece data, indexed by piece id = tile index * cells + offset of the piece's smallest cell
+        n = self.shape[0] * self.shape[1] * self.cells
+        self.piece = np.zeros((self.rows, self.columns), dtype=np.int64)     # piece id of every cell
+        self.size = np.zeros(n, dtype=np.int64)
+        self.perimeter = np.zeros(n, dtype=np.int64)
+        self.strategy = np.zeros(n, dtype=np.int8)
+        self.interior = np.zeros(n, dtype=bool)
+
+        # clusters that lie inside one tile: count of every size, per strategy (0 defect, 1 coop), and perimeters
+        self.interior_sizes = np.zeros((2, self.cells + 1), dtype=np.int64)
+        self.interior_perimeter = np.zeros(2, dtype=np.int64)
+
+        self.border_pairs()
+        self.refresh()
+
+    '''
+    the pairs (a, b) of neighboring cells (flat indices) that lie in different tiles or are joined by the
+    wrap-around, and the pairs touching every tile: tile_pairs[tile_start[t]:tile_start[t + 1]] for tile t
+    '''
+    def border_pairs(self):
+        rr, cc = np.meshgrid(np.arange(self.rows), np.arange(self.columns), indexing="ij")
+        tr, tc = rr // self.tile, cc // self.tile
+
+        a, b = [], []
+        for (dr, dc) in HALF_NEIGHBORS[self.connectivity]:
+            nr, nc = (rr + dr) % self.rows, (cc + dc) % self.columns
+            crossing = (nr // self.tile != tr) | (nc // self.tile != tc) | (rr + dr != nr) | (cc + dc != nc)
+            a.append((rr * self.columns + cc)[crossing])
+            b.append((nr * self.columns + nc)[crossing])
+        self.pair_a = np.concatenate(a)
+        self.pair_b = np.concatenate(b)
+
+        # a pair is listed under both of its tiles (once if it wraps around inside one tile)
+        tile_of = (tr * self.shape[1] + tc).reshape(-1)
+        ta, tb = tile_of[self.pair_a], tile_of[self.pair_b]
+        two = np.flatnonzero(ta != tb)
+        owner = np.concatenate((ta, tb[two]))
+        order = np.argsort(owner, kind="stable")
+        self.tile_pairs = np.concatenate((np.arange(len(ta)), two))[order]
+        counts = np.bincount(owner, minlength=self.shape[0] * self.shape[1])
+        self.tile_start = np.concatenate(([0], np.cumsum(counts)))
+
+    # indices of the pairs touching any of the tiles (flat tile indices)
+    def pairs_of(self, tiles):
+        start = self.tile_start[tiles]
+        lengths = self.tile_start[tiles + 1] - start
+        at = np.repeat(start - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.tile_pairs[at])
+
+    # relabels every tile
+    def refresh(self):
+        self.size[:] = 0
+        self.interior[:] = False
+        self.interior_sizes[:] = 0
+        self.interior_perimeter[:] = 0
+
+        # links between border pieces of neighboring tiles, the live border pieces and the cluster of each
+        # (its smallest piece), and the table of clusters made of border pieces
+        self.link_a = np.zeros(0, dtype=np.int64)
+        self.link_b = np.zeros(0, dtype=np.int64)
+        self.border = np.zeros(0, dtype=np.int64)
+        self.cluster = np.zeros(len(self.size), dtype=np.int64)
+        self.roots = np.zeros(0, dtype=np.int64)
+        self.cluster_size = np.zeros(0, dtype=np.int64)
+        self.cluster_perimeter = np.zeros(0, dtype=np.int64)
+
+        tiles = np.argwhere(np.ones(self.shape, dtype=bool))
+        self.join(tiles, *self.relabel(tiles))
+        self.generation = self.colony.generation
+
+    '''
+    folds the last generation into the clusters: relabels the tiles within one cell of a flipped cell
+    '''
+    def update(self):
+        generation = self.colony.generation
+        if generation == self.generation:
+            return
+        if generation != self.generation + 1:
+            self.refresh()
+            return
+        self.generation = generation
+
+        flipped = self.colony.flipped
+        if len(flipped) == 0:
+            return
+        r, c = flipped // self.columns, flipped % self.columns
+        dirty = np.zeros(self.shape, dtype=bool)
+        for (dr, dc) in [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)]:
+            dirty[((r + dr) % self.rows) // self.tile, ((c + dc) % self.columns) // self.tile] = True
+        tiles = np.argwhere(dirty)
+        self.join(tiles, *self.relabel(tiles))
+
+    '''
+    relabels the tiles (rows of tile coordinates)
+    returns the border pieces of the tiles before and after
+    '''
+    def relabel(self, tiles):
+        coop = self.colony.coop
+        t = self.tile
+        k = len(tiles)
+        ids = tiles[:, 0] * self.shape[1] + tiles[:, 1]
+
+        # forget the old pieces of these tiles
+        old = (ids[:, None] * self.cells + np.arange(self.cells)).reshape(-1)
+        old = old[self.size[old] > 0]
+        gone = old[self.interior[old]]
+        old_border = old[~self.interior[old]]
+        np.subtract.at(self.interior_sizes, (self.strategy[gone], self.size[gone]), 1)
+        np.subtract.at(self.interior_perimeter, self.strategy[gone], self.perimeter[gone])
+        self.size[old] = 0
+        self.interior[old] = False
+
+        # stack of the tiles with a one-cell wrapped margin; tiles cut short by the grid edge are padded
+        # with OUTSIDE (their margin is still the wrapped row or column right after the edge)
+        r = tiles[:, 0, None] * t + np.arange(-1, t + 1)
+        c = tiles[:, 1, None] * t + np.arange(-1, t + 1)
+        window = coop[(r % self.rows)[:, :, None], (c % self.columns)[:, None, :]]
+        centre = window[:, 1:-1, 1:-1]
+        unlike = (centre != window[:, :-2, 1:-1]).astype(np.int8) + (centre != window[:, 2:, 1:-1]) + \
+                 (centre != window[:, 1:-1, :-2]) + (centre != window[:, 1:-1, 2:])
+
+        height = np.minimum(self.rows - tiles[:, 0] * t, t)[:, None, None]
+        width = np.minimum(self.columns - tiles[:, 1] * t, t)[:, None, None]
+        rr = np.arange(t)[None, :, None]
+        cc = np.arange(t)[None, None, :]
+        inside = (rr < height) & (cc < width)
+        border = inside & ((rr == 0) | (rr == height - 1) | (cc == 0) | (cc == width - 1))
+        stack = np.where(inside, centre, OUTSIDE).astype(np.int8)
+
+        # every cell's label is the stack index of its piece's smallest cell, the piece's root
+        labels = label_tiles(stack, self.connectivity)
+        cells = ((r[:, 1:-1, None] % self.rows) * self.columns + c[:, None, 1:-1] % self.columns)[inside]
+        root_labels = labels[inside]
+        self.piece.reshape(-1)[cells] = ids[root_labels // self.cells] * self.cells + root_labels % self.cells
+
+        # sizes, perimeters and strategies of the new pieces
+        counts = np.bincount(root_labels, minlength=stack.size)
+        roots = np.flatnonzero(counts)
+        perimeters = np.bincount(root_labels, weights=unlike[inside], minlength=stack.size)
+        pieces = ids[roots // self.cells] * self.cells + roots % self.cells
+        self.size[pieces] = counts[roots]
+        self.perimeter[pieces] = perimeters[roots]
+        self.strategy[pieces] = stack.reshape(-1)[roots]
+
+        on_border = np.zeros(stack.size, dtype=bool)
+        on_border[labels[border]] = True
+        new = pieces[~on_border[roots]]
+        self.interior[new] = True
+        np.add.at(self.interior_sizes, (self.strategy[new], self.size[new]), 1)
+        np.add.at(self.interior_perimeter, self.strategy[new], self.perimeter[new])
+        return old_border, pieces[on_border[roots]]
+
+    '''
+    joins the border pieces across the tile borders again after the tiles (rows of tile coordinates) were
+    relabeled: the links touching those tiles are rebuilt, and the clusters that had pieces in the tiles or
+    are linked to their new pieces are joined again from their pieces; all other clusters are kept
+    old, new - the border pieces of the tiles before and after relabeling
+    '''
+    def join(self, tiles, old, new):
+        ids = tiles[:, 0] * self.shape[1] + tiles[:, 1]
+        dirty = np.zeros(self.shape[0] * self.shape[1], dtype=bool)
+        dirty[ids] = True
+        n = len(self.size)
+
+        # links between the pieces of same-strategy pairs touching the tiles, each link once
+        pairs = self.pairs_of(ids)
+        a, b = self.pair_a[pairs], self.pair_b[pairs]
+        coop = self.colony.coop.reshape(-1)
+        same = coop[a] == coop[b]
+        piece = self.piece.reshape(-1)
+        a, b = piece[a[same]], piece[b[same]]
+        links = np.unique((np.minimum(a, b) * n + np.maximum(a, b))[a != b])
+        a, b = links // n, links % n
+        kept = ~(dirty[self.link_a // self.cells] | dirty[self.link_b // self.cells])
+        self.link_a = np.concatenate((self.link_a[kept], a))
+        self.link_b = np.concatenate((self.link_b[kept], b))
+
+        # clusters to join again, and all their pieces outside the tiles
+        ends = np.concatenate((a, b))
+        ends = ends[~dirty[ends // self.cells]]
+        affected = np.unique(np.concatenate((self.cluster[old], self.cluster[ends])))
+        self.border = self.border[~dirty[self.border // self.cells]]
+        members = self.border[np.isin(self.cluster[self.border], affected)]
+        self.border = np.concatenate((self.border, new))
+
+        # union-find over those pieces and the new ones; their links lead only to each other
+        nodes = np.sort(np.concatenate((members, new)))
+        at = np.searchsorted(nodes, self.link_a)
+        inner = at < len(nodes)
+        inner[inner] = nodes[at[inner]] == self.link_a[inner]
+        roots = union_roots(len(nodes), at[inner], np.searchsorted(nodes, self.link_b[inner]))
+        self.cluster[nodes] = nodes[roots]
+        clusters, cluster_of = np.unique(roots, return_inverse=True)
+        size = np.bincount(cluster_of, weights=self.size[nodes], minlength=len(clusters)).astype(np.int64)
+        perimeter = np.bincount(cluster_of, weights=self.perimeter[nodes], minlength=len(clusters)).astype(np.int64)
+
+        kept = ~np.isin(self.roots, affected)
+        self.roots = np.concatenate((self.roots[kept], nodes[clusters]))
+        self.cluster_size = np.concatenate((self.cluster_size[kept], size))
+        self.cluster_perimeter = np.concatenate((self.cluster_perimeter[kept], perimeter))
+        self.cluster_strategy = self.strategy[self.roots]
+
+    '''
+    clusters made of pieces on the tile borders, joined across the borders
+    returns (strategy, size, perimeter) arrays with one entry per cluster
+    '''
+    def border_clusters(self):
+        return self.cluster_strategy, self.cluster_size, self.cluster_perimeter
+
+    '''
+    sizes of all the clusters of a strategy (True for cooperators), largest first
+    '''
+    def sizes(self, coop=True):
+        strategy, size, perimeter = self.border_clusters()
+        interior = self.interior_sizes[int(coop)]
+        sizes = np.concatenate((size[strategy == int(coop)], np.repeat(np.arange(len(interior)), interior)))
+        return np.sort(sizes)[::-1]
+
+    # cluster counts, sizes and perimeters of both strategies
+    def stats(self):
+        strategy, size, perimeter = self.border_clusters()
+        bins = max(self.rows * self.columns, 1).bit_length()
+        result = []
+        for s in (1, 0):
+            border = size[strategy == s]
+            interior = self.interior_sizes[s]
+            sizes_present = np.flatnonzero(interior)
+
+            count = len(border) + int(interior.sum())
+            cells = int(border.sum()) + int((interior * np.arange(len(interior))).sum())
+            largest = max(int(border.max()) if len(border) else 0,
+                          int(sizes_present[-1]) if len(sizes_present) else 0)
+
+            histogram = np.bincount(np.log2(np.maximum(border, 1)).astype(int), minlength=bins)[:bins]
+            np.add.at(histogram, np.log2(sizes_present).astype(int), interior[sizes_present])
+
+            result.append(StrategyClusters(count, largest, cells / count if count else 0.0,
+                                           int(perimeter[strategy == s].sum()) + int(self.interior_perimeter[s]),
+                                           histogram))
+        return ClusterStats(self.generation, result[0], result[1])
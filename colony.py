@@ -4,10 +4,33 @@
 # Winter 2017, CS76: Evolutionary Game Dynamics
 # Final Project
 
+import itertools
+from collections import namedtuple
+
+import numpy as np
 from cell import Cell
-from random import *
+from active_tiles import ActiveTiles
+from random_streams import RandomStreams
+from dynamics import *
+from weighting_functions import weight_kernel
+from timing import phase_timer
 from math import *
 
+# names of the update rules and preset grid formations, as shown in the GUI
+UPDATE_RULES = ["Threshold", "Perfect Best Response", "Irrational Best Response"]
+PRESETS = ["All Cooperators", "von Neumann", "3x3 Defectors", "5x5 Defectors"]
+
+# short names for the update rules on the command line
+RULE_ALIASES = {"threshold": "Threshold",
+                "pbr": "Perfect Best Response",
+                "ibr": "Irrational Best Response"}
+
+'''
+what Colony.generations() yields after every step
+state - read-only view of the strategy array if it was asked for, else None
+'''
+Generation = namedtuple("Generation", ["generation", "changed", "coop_fraction", "state"])
+
 class Colony:
     def __init__(self, rows, columns, cell_size, settings):
         self.rows = rows
@@ -16,19 +39,87 @@ class Colony:
 
         self.settings = settings # has COOP_COLOR, DEFECT_COLOR, threshold, stubbornness, payoff, silence, etc
 
-        self.cells = []
+        # tiles that changed last generation; deterministic rules only recompute around them
+        self.active = ActiveTiles(rows, columns)
+        self.rule_key = None
+
+        # functions called with the changed region after every change of state, see notify()
+        self.listeners = []
+
+        # number of cooperators, kept up to date from the flipped cells; None when it has to be recounted
+        self._coop_count = None
+
+        # struct-of-arrays cell data; pixel coordinates are derived from (r, c) on demand
+        self.coop = np.ones((rows, columns), dtype=bool)        # True if coop, False if defect
+        self.silent = np.zeros((rows, columns), dtype=bool)     # for use in the opt out via silence option
+
+        # flat indices (r * columns + c) of the cells that changed strategy in the last generation
+        self.flipped = np.zeros(0, dtype=np.intp)
 
-        # create the cell data list
-        for r in range(rows):
-            y = r * cell_size
-            for c in range(columns):
-                x = c * cell_size
-                cell = Cell(x, y, cell_size)
-                self.cells.append(cell)
+        # the random draws of the update rules, keyed by (generation, draw, cell), see random_streams.py
+        self.streams = RandomStreams(settings.seed)
 
-    def draw(self):
-        for cell in self.cells:
-            cell.draw(self.settings.COOP_COLOR, self.settings.DEFECT_COLOR)
+        # generator for random starting grids
+        self.rng = np.random.default_rng(settings.seed)
+
+        # ParallelStepper that computes the generations in worker processes (see parallel.py), or None
+        self.stepper = None
+
+        self.generation = 0
+
+    '''
+    starts the colony over (all cooperators, nobody silent, generation 0) so it can be reused for another run;
+    the random streams are rekeyed from settings.seed, and settings can be replaced at the same time
+    '''
+    def reset(self, settings=None):
+        if settings is not None:
+            self.settings = settings
+
+        self.coop = np.ones((self.rows, self.columns), dtype=bool)
+        self.silent[:] = False
+        self.flipped = np.zeros(0, dtype=np.intp)
+        self.rule_key = None
+
+        self.streams = RandomStreams(self.settings.seed)
+        self.rng = np.random.default_rng(self.settings.seed)
+        self.generation = 0
+
+    '''
+    strategy array (True if coop, False if defect)
+    Assigning a new array marks the whole grid as changed; edits made in place through the array
+    (rather than through cell() or the presets) must be followed by self.grid_changed()
+    '''
+    @property
+    def coop(self):
+        return self._coop
+
+    @coop.setter
+    def coop(self, value):
+        self._coop = value
+        self.grid_changed()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    '''
+    tells the listeners which cells changed: region is a (r0, r1, c0, c1) range of cells (rows r0 to r1 - 1,
+    columns c0 to c1 - 1), or None for the whole grid
+    '''
+    def notify(self, region=None):
+        for listener in self.listeners:
+            listener(region)
+
+    # the cell at r, c was edited from outside the update rules
+    def cell_changed(self, r, c):
+        self._coop_count = None
+        self.active.mark(r, c)
+        self.notify((r, r + 1, c, c + 1))
+
+    # any cell may have been edited from outside the update rules
+    def grid_changed(self):
+        self._coop_count = None
+        self.active.mark_all()
+        self.notify()
 
     # compute the index of a cell at r,c in the grid
     def ci(self, r, c):
@@ -37,122 +128,50 @@ class Colony:
         index = r * self.columns + c
         return index
 
-    # get the cell object at r, c
+    # get a view of the cell at r, c
     def cell(self, r, c):
-        index = self.ci(r, c)
-        return self.cells[index]
+        return Cell(self, r % self.rows, c % self.columns)
 
-    # count cooperating neighbors adjacent to r, c
+    # count cooperating neighbors of r, c within the interaction radius
     def count_coop_neighbors(self, r, c):
         coop_neighbors = 0
 
-        for dr in range(-1, 2):
-            for dc in range(-1, 2):
-                if dr != 0 or dc != 0:
-                    nr = r + dr
-                    nc = c + dc
-                    if self.cell(nr, nc).coop:
-                        coop_neighbors += 1
+        for (dr, dc) in square_offsets(self.settings.interaction_radius):
+            nr = (r + dr) % self.rows
+            nc = (c + dc) % self.columns
+            if self.coop[nr, nc]:
+                coop_neighbors += 1
 
         return coop_neighbors
 
     '''
     Computes the next generation of cells using standard threshold
-    threshold - the minimum number of defecting neighbors required for this neighbor to defect
+    threshold - the minimum number of defecting neighbors (within the interaction radius) required for this neighbor to defect
     '''
     def next_generation_threshold(self):
-        # create a temporary list to store status of cells
-        # for the next generation
-        lnext = [True] * len(self.cells)
-
-        # Use the threshold to update the temporary list
-        for r in range(self.rows):
-            for c in range(self.columns):
-                coop_n = self.count_coop_neighbors(r, c)
-                def_n = 8 - coop_n
+        threshold = self.settings.threshold
+        radius = self.settings.interaction_radius
 
-                if def_n >= self.settings.threshold:          #if you have enough defecting neighbors, you defect
-                    cell_idx = self.ci(r, c)
-                    lnext[cell_idx] = False
+        # count every cell's defecting neighbors in one pass over the torus (or over the live tiles)
+        def rule(coop, silent, lap):
+            lnext = threshold_step(coop, threshold, radius)
+            lap.part("rule")
+            return lnext
 
-        # Use the temporary list to update cells,
-        # moving into the next generation
-        for i in range(len(self.cells)):
-            self.cells[i].coop = lnext[i]
+        self.update_active(rule, radius, ("Threshold", threshold, radius))
 
     '''
     Updates cell boolean "silent", whether a given individual is silent or not in a particular round
+    rng - the random draws of the generation, see RandomStreams.at
     '''
-    def update_cell_silence(self):
-        for cell in self.cells:
-            rand = random()
-            if rand <= self.settings.silence:
-                cell.silent = True
-            else:
-                cell.silent = False
+    def update_cell_silence(self, rng):
+        self.silent = rng.random((self.rows, self.columns)) <= self.settings.silence
 
     '''
     Resets the silence map to all false, so no residual values interfere
     '''
     def reset_silence_map(self):
-        for cell in self.cells:
-            cell.silent = False
-
-    '''
-    establish payoff of each cell
-    Params:
-    r - row of central pixel
-    c - col of central pixel
-    '''
-    def calc_cell_payoff(self, r, c, weight_func):
-        p = 0
-        strategy = self.cell(r, c).coop     # true if coop, false if defect
-
-        for dr in range(-1, 2):         #only looks at -1, 0, 1
-            for dc in range(-1, 2):     #only looks at -1, 0, 1
-                if dr != 0 or dc != 0:  # don't look at central pixel
-                    nr = (r + dr) % self.rows
-                    nc = (c + dc) % self.columns
-
-                    #compute payoff weighting (proportional to distance)
-                    alpha = weight_func(r,c,nr,nc)
-
-                    #if neighbor not silent, calculate their opinion
-                    if not self.cell(nr, nc).silent:
-                        if self.cell(nr, nc).coop:      #neighbor coop
-                            if strategy:
-                                p += alpha * self.settings.payoff[0]          #cc
-                            else:
-                                p += alpha * self.settings.payoff[2]          #dc
-                        else:
-                            if strategy:
-                                p += alpha * self.settings.payoff[1]          #cd
-                            else:
-                                p += alpha * self.settings.payoff[3]          #dd
-        #print(r, c, nr, nc, alpha)
-        return p
-
-    '''
-    '''
-    def irrational_neighbor_pick(self, r, c):
-        n = randint(1,9) #from [1,8]
-        if n == 1:
-            return (-1,-1)
-        elif n==2:
-            return (-1, 0)
-        elif n==3:
-            return (-1, 1)
-        elif n==4:
-            return (0, -1)
-        elif n==5:
-            return (0, 1)
-        elif n==6:
-            return (1, -1)
-        elif n==7:
-            return (1, 0)
-        else:
-            return (1, 1)
-
+        self.silent[:] = False
 
     '''
     use best response to update cells for next generation
@@ -160,98 +179,188 @@ class Colony:
     weight_func - function used to compute the weighting for degrees of influence
     '''
     def next_generation_best_response(self, weight_func, irrational=False):
-        # create a temporary list to store status of cells
-        # for the next generation
-        lnext = [True] * len(self.cells)
+        lap = phase_timer.start()
+        rng = self.streams.at(self.generation)
 
         # update silent instances if necessary
         if self.settings.silence != 0:
-            self.update_cell_silence()
+            self.update_cell_silence(rng)
+            lap.lap("silence")
         else:
-            print("resetting")
             self.reset_silence_map()
 
-        # calculate payoffs for all cells
-        p_now = [0] * len(self.cells)
-        for r in range(self.rows):
-            for c in range(self.columns):
-                cell_idx = self.ci(r, c)
-                p_now[cell_idx] = self.calc_cell_payoff(r, c, weight_func)
-
-        # Update strategy in temporary list
-        for r in range(self.rows):
-            for c in range(self.columns):
-                cell_idx = self.ci(r, c)
-                rand = random()     #random number in [0.0, 1.0)
-                if rand < self.settings.stubbornness:
-                    lnext[cell_idx] = self.cell(r, c).coop   # keep original strategy (too stubborn to switch)
-
-                elif irrational:        # update using irrational best response
-                    pa = p_now[cell_idx]                       # central cell payoff
-
-                    # pick random neighbor
-                    (n_dr, n_dc) = self.irrational_neighbor_pick(r, c)
-                    n_r = (r + n_dr) % self.rows
-                    n_c = (c + n_dc) % self.columns
-                    n_index = self.ci(n_r, n_c)
-                    if self.cells[n_index].silent:
-                        lnext[cell_idx] = self.cell(r, c).coop                   # if neighbor silent, keep strategy
-                        continue
-
-                    pb = p_now[n_index]        # neighbor's payoff
-
-                    # calculate prob of switching
-                    power = -1*self.settings.beta*(pb - pa)
-                    try:
-                        prob_of_switch = 1.0 / (1 + exp(power))
-                    except OverflowError:
-                        if power < 0:
-                            prob_of_switch = 1.0        #overflowed because exp was too small
-                        else:
-                            prob_of_switch = 0.0        # overflowed because exp was too big
-
-                    # pick random number q in [0,1]
-                    rand2 = random()
-                    if rand2 < prob_of_switch:
-                        lnext[cell_idx] = self.cell(n_r, n_c).coop   # adopt neighbor strategy
-                    else:
-                        lnext[cell_idx] = self.cell(r, c).coop      # keep original strategy
-
-                # if we are rational and not too stubborn, compute best strategy -- perfect best response
-                else:
-                    best_strategy = self.cells[cell_idx].coop # mine is current best strategy
-                    best_payoff = p_now[cell_idx]
-
-                    # look at your neighbors responses (and your own); keep strategy of best one
-                    for dr in range(-1, 2):         #only looks at -1, 0, 1
-                        for dc in range(-1, 2):     #only looks at -1, 0, 1
-                            nr = r + dr
-                            nc = c + dc
-                            ni = self.ci(nr, nc)
-
-                            if p_now[ni] > best_payoff: #only if better than your current best response
-                                best_payoff = p_now[ni]
-                                best_strategy = self.cell(nr, nc).coop
-                            if p_now[ni] == best_payoff:
-                                if self.cells[ni].coop == self.cells[cell_idx].coop: # keep strategy similar to yours
-                                    best_strategy = self.cell(nr, nc).coop              # if multiple best responses
-
-                    lnext[cell_idx] = best_strategy         #adopt the best strategy
+        kernel = weight_kernel(weight_func, self.settings.interaction_radius)
+        payoff = list(self.settings.payoff)
+        imitation_radius = self.settings.imitation_radius
 
+        if not irrational and self.settings.silence == 0 and self.settings.stubbornness == 0:
+            # perfect best response is deterministic: only recompute around the cells that changed
+            def rule(coop, silent, lap):
+                p_now = payoff_field(coop, silent, kernel, payoff)
+                lap.part("payoff")
+                lnext = best_response_step(coop, p_now, imitation_radius)
+                lap.part("select")
+                return lnext
 
+            key = ("Perfect Best Response", tuple(payoff), weight_func, self.settings.interaction_radius,
+                   imitation_radius)
+            self.update_active(rule, self.settings.interaction_radius + imitation_radius, key)
+            return
+
+        # calculate payoffs for all cells
+        p_now = payoff_field(self.coop, self.silent, kernel, payoff)
+        lap.lap("payoff")
+
+        if irrational:        # update using irrational best response
+            lnext = fermi_step(self.coop, self.silent, p_now, self.settings.beta, self.settings.stubbornness,
+                               rng, self.settings.imitation_radius)
+        else:
+            # if we are rational and not too stubborn, compute best strategy -- perfect best response
+            rand = rng.random((self.rows, self.columns))     #random numbers in [0.0, 1.0)
+            lnext = best_response_step(self.coop, p_now, self.settings.imitation_radius)
+            lnext = np.where(rand < self.settings.stubbornness, self.coop, lnext)   # too stubborn to switch
+        lap.lap("select")
 
         # Update cell strategies for next generation
-        for i in range(len(self.cells)):
-            self.cells[i].coop = lnext[i]
+        self.rule_key = None        # stochastic, every cell is live
+        self.commit(lnext)
+        lap.lap("commit")
 
     def irrational_best_response(self, weight_func):
         self.next_generation_best_response(weight_func, True)
 
+    # True when the next generation under settings.next_gen_type depends only on the current strategies
+    def is_deterministic(self):
+        if self.settings.next_gen_type == "Threshold":
+            return True
+        return self.settings.next_gen_type == "Perfect Best Response" and \
+               self.settings.silence == 0 and self.settings.stubbornness == 0
+
+    '''
+    replaces the strategy array with the next generation and records which cells changed
+    '''
+    def commit(self, lnext):
+        self.flipped = np.flatnonzero(lnext != self._coop)
+        self._coop = lnext
+        self.active.record(self.flipped)
+        self.count_flips()
+        if len(self.flipped):
+            self.notify()
+
+    '''
+    applies a deterministic rule only to the live tiles (those within halo of last generation's changes),
+    or to the whole grid when activity is widespread
+    Params:
+    rule - function (coop, silent, lap) -> next coop; it is also applied to wrapped windows of the grid, and
+           marks the end of its phases with lap.part()
+    halo - how far (in cells) a change can travel in one generation under the rule
+    key - the settings the rule depends on; when they change, every cell is recomputed
+    '''
+    def update_active(self, rule, halo, key):
+        lap = phase_timer.start()
+        if key != self.rule_key:
+            self.rule_key = key
+            self.active.mark_all()
+
+        live = self.active.live(halo)
+        lap.lap("tiles")
+        if live is None:
+            lnext = rule(self._coop, self.silent, lap)
+            lap.end_parts()
+            self.commit(lnext)
+            lap.lap("commit")
+            return
+
+        # compute every live run from the current generation first, then write them back
+        updates = []
+        for (r0, r1, c0, c1) in self.active.runs(live):
+            window = np.ix_(np.arange(r0 - halo, r1 + halo) % self.rows,
+                            np.arange(c0 - halo, c1 + halo) % self.columns)
+            lnext = rule(self._coop[window], self.silent[window], lap)
+            updates.append((r0, c0, lnext[halo:halo + r1 - r0, halo:halo + c1 - c0]))
+        lap.end_parts()
+
+        flipped = [np.zeros(0, dtype=np.intp)]
+        for (r0, c0, lnext) in updates:
+            region = self._coop[r0:r0 + lnext.shape[0], c0:c0 + lnext.shape[1]]
+            rr, cc = np.nonzero(lnext != region)
+            flipped.append((rr + r0) * self.columns + (cc + c0))
+            region[...] = lnext
+            if len(rr):
+                self.notify((r0, r0 + lnext.shape[0], c0, c0 + lnext.shape[1]))
+
+        self.flipped = np.concatenate(flipped)
+        self.active.record(self.flipped)
+        self.count_flips()
+        lap.lap("commit")
+
+    # updates the number of cooperators from the cells that flipped in the last generation
+    def count_flips(self):
+        if self._coop_count is not None:
+            now_coop = np.count_nonzero(self._coop[self.flipped // self.columns, self.flipped % self.columns])
+            self._coop_count += 2 * now_coop - len(self.flipped)
+
+    '''
+    computes the next generation with the update rule named by settings.next_gen_type
+    returns the number of cells that changed strategy
+    '''
+    def next_generation(self):
+        if self.stepper is not None:
+            self.stepper.step()
+        elif self.settings.next_gen_type == "Threshold":
+            self.next_generation_threshold()
+        elif self.settings.next_gen_type == "Perfect Best Response":
+            self.next_generation_best_response(self.settings.weight_func)
+        elif self.settings.next_gen_type == "Irrational Best Response":
+            self.irrational_best_response(self.settings.weight_func)
+        else:
+            raise ValueError("Unrecognized update function: " + str(self.settings.next_gen_type))
+
+        self.generation += 1
+        return len(self.flipped)
+
+    # fraction of cells that cooperate
+    def coop_fraction(self):
+        if self._coop_count is None:
+            self._coop_count = int(np.count_nonzero(self._coop))
+        return self._coop_count / self._coop.size
+
+    # read-only view of the strategy array; later in-place updates show through it, so copy it to keep a state
+    def state_view(self):
+        view = self._coop.view()
+        view.flags.writeable = False
+        return view
+
+    '''
+    steps the colony lazily and yields a Generation after every step, for n generations or until the
+    consumer stops asking (n=None); state=True adds state_view() to every result
+    Nothing is copied, so arbitrarily long runs stream in constant memory, e.g.
+        for g in itertools.takewhile(lambda g: g.changed, hive.generations()): ...
+    '''
+    def generations(self, n=None, state=False):
+        steps = itertools.count() if n is None else range(n)
+        for _ in steps:
+            changed = self.next_generation()
+            yield Generation(self.generation, changed, self.coop_fraction(), self.state_view() if state else None)
+
 
     # Presets
+    # (r,c) coordinates of central pixel; name is one of PRESETS
+    def apply_preset(self, name, r, c):
+        if name == "All Cooperators":
+            self.preset_all_blue()
+        elif name == "von Neumann":
+            self.preset_vonNeumann(r, c)
+        elif name == "3x3 Defectors":
+            self.preset_3x3(r, c)
+        elif name == "5x5 Defectors":
+            self.preset_5x5(r, c)
+        else:
+            raise ValueError("Unrecognized preset: " + str(name))
+
     def preset_all_blue(self):
-        for i in range(len(self.cells)):
-            self.cells[i].coop = True
+        self.coop[:] = True
+        self.grid_changed()
 
     # (r,c) coordinates of central pixel
     def preset_3x3(self, r, c):
@@ -281,5 +390,5 @@ class Colony:
         self.cell(r, c+1).coop = False
 
     def print_sil_map(self):
-        for i in range(len(self.cells)):
-            print(self.cells[i].silent)
\ No newline at end of file
+        for silent in self.silent.flat:
+            print(silent)
\ No newline at end of file
@@ -1,3 +1,6 @@
+import json
+from weighting_functions import WEIGHT_FUNCTIONS
+
 class ColonyParams():
     def __init__(self):
         self.COOP_COLOR = [0.0, 0.0, 0.8]
@@ -7,15 +10,49 @@ class ColonyParams():
         self.stubbornness = 0.0
         self.silence = 0.0
         self.weight_func = None
+        self.interaction_radius = 1     # payoffs (and threshold counts) come from neighbors within this radius
+        self.imitation_radius = 1       # strategies are copied from neighbors within this radius
         self.next_gen_type = None
         self.beta = 1000
+        self.seed = None                # seed for the colony's random draws (None for a fresh one every run)
         self.preset = "All Cooperators"
 
+    '''
+    sets parameters from a dictionary of attribute names to values
+    weight_func may be given by its GUI name, e.g. "Inverse Manhattan"
+    '''
+    def update(self, values):
+        for name, value in values.items():
+            if not hasattr(self, name):
+                raise KeyError("Unknown colony parameter: " + name)
+            if name == "weight_func" and isinstance(value, str):
+                value = WEIGHT_FUNCTIONS[value]
+            setattr(self, name, value)
+
+    '''
+    dictionary of all parameters, with weight_func given by its GUI name, that update() accepts back
+    '''
+    def as_dict(self):
+        values = dict(vars(self))
+        values["payoff"] = list(self.payoff)
+        for name, func in WEIGHT_FUNCTIONS.items():
+            if func is self.weight_func:
+                values["weight_func"] = name
+        return values
+
+    # reads parameters from a JSON file holding a dictionary, see update()
+    def load(self, path):
+        with open(path) as f:
+            self.update(json.load(f))
+
     def __str__(self):
         return "\nThreshold: " + str(self.threshold) +\
                 "\nPayoff: " + str(self.payoff) +\
                 "\nStubbornness: " + str(self.stubbornness) +\
                 "\nSilence: " + str(self.silence) +\
                 "\nWeight function: " + str(self.weight_func) +\
+                "\nInteraction radius: " + str(self.interaction_radius) +\
+                "\nImitation radius: " + str(self.imitation_radius) +\
                 "\nNext Gen Type: " + str(self.next_gen_type) +\
-                "\nBeta: " + str(self.beta)
\ No newline at end of file
+                "\nBeta: " + str(self.beta) +\
+                "\nSeed: " + str(self.seed)
\ No newline at end of file
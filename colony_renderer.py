@@ -0,0 +1,50 @@
+# Qt rendering backend for the Colony
+# The model (colony.py, cell.py, ...) never imports this module, so it stays usable without a display
+# Colonies are drawn as framebuffers: the strategy array is mapped to pixels with one color lookup,
+# wrapped in a QImage and scaled up to the cell size in a single blit
+
+import numpy as np
+from canvas import *
+
+# 32-bit Qt color of an [r, g, b] color with components in [0, 1]
+def qt_rgb(color):
+    return qRgb(int(color[0] * 255), int(color[1] * 255), int(color[2] * 255))
+
+# blits a one-pixel-per-cell image at cell scale, without smoothing between cells
+def draw_cells(image, columns, rows, size, x=0, y=0):
+    draw_image(image.scaled(columns * size, rows * size, Qt.IgnoreAspectRatio, Qt.FastTransformation), x, y)
+
+'''
+draws a Colony from its strategy array: defectors and cooperators index a two-entry color table
+coop - strategy array to draw instead of colony.coop, e.g. a frame copied by a SimulationWorker
+'''
+def draw_colony(colony, coop=None):
+    if coop is None:
+        coop = colony.coop
+    colors = np.array([qt_rgb(colony.settings.DEFECT_COLOR), qt_rgb(colony.settings.COOP_COLOR)], dtype=np.uint32)
+    pixels = np.ascontiguousarray(colors[coop.view(np.uint8)])
+
+    image = QImage(pixels.data, colony.columns, colony.rows, pixels.strides[0], QImage.Format_RGB32)
+    draw_cells(image, colony.columns, colony.rows, colony.cell_size)
+
+'''
+redraws only the cells in rows r0 to r1 - 1 and columns c0 to c1 - 1
+'''
+def draw_colony_region(colony, r0, r1, c0, c1, coop=None):
+    if coop is None:
+        coop = colony.coop
+    colors = np.array([qt_rgb(colony.settings.DEFECT_COLOR), qt_rgb(colony.settings.COOP_COLOR)], dtype=np.uint32)
+    pixels = np.ascontiguousarray(colors[coop[r0:r1, c0:c1].view(np.uint8)])
+
+    image = QImage(pixels.data, c1 - c0, r1 - r0, pixels.strides[0], QImage.Format_RGB32)
+    size = colony.cell_size
+    draw_cells(image, c1 - c0, r1 - r0, size, c0 * size, r0 * size)
+
+'''
+draws a PackedColony straight from its words: every row of 64-bit little-endian words is a
+row of a 1-bit QImage (bit 0 is the leftmost pixel)
+'''
+def draw_packed_colony(colony):
+    image = QImage(colony.coop.data, colony.columns, colony.rows, colony.coop.strides[0], QImage.Format_MonoLSB)
+    image.setColorTable([qt_rgb(colony.settings.DEFECT_COLOR), qt_rgb(colony.settings.COOP_COLOR)])
+    draw_cells(image, colony.columns, colony.rows, colony.cell_size)
@@ -0,0 +1,25 @@
+# Fixtures shared by the test_*.py modules
+
+import pytest
+from colony import *
+from colonyParams import *
+from weighting_functions import WEIGHT_FUNCTIONS
+
+'''
+factory of colonies with a random grid (about 70% cooperators) drawn from the colony's own generator
+make_colony(rule, rows, columns, extra, seed) - extra holds ColonyParams values, and "weight" the name of a
+                                                weighting function
+'''
+@pytest.fixture
+def make_colony():
+    def make(rule, rows, columns, extra={}, seed=5):
+        extra = dict(extra)
+        settings = ColonyParams()
+        settings.next_gen_type = rule
+        settings.weight_func = WEIGHT_FUNCTIONS[extra.pop("weight", "Uniform")]
+        settings.seed = seed
+        settings.update(extra)
+        hive = Colony(rows, columns, 1, settings)
+        hive.coop = hive.rng.random((rows, columns)) >= 0.3
+        return hive
+    return make
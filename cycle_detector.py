@@ -0,0 +1,75 @@
+# Fixed-point and cycle detection for Colony runs
+# The state is hashed Zobrist-style: the XOR of a pseudo-random 64-bit key per defecting cell. Each generation
+# the hash is updated from the cells that flipped (Colony.flipped), so detection costs far less than a step.
+
+from collections import deque
+import numpy as np
+
+SALT = np.uint64(0x5DEECE66DA3B9F21)
+
+'''
+pseudo-random 64-bit key of every flat cell index (splitmix64 finalizer), computed on the fly
+'''
+def cell_keys(indices):
+    z = indices.astype(np.uint64) ^ SALT
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def xor_keys(indices):
+    if len(indices) == 0:
+        return np.uint64(0)
+    return np.bitwise_xor.reduce(cell_keys(indices))
+
+'''
+Watches a colony and notices when a deterministic rule revisits a state
+After detection, period is the cycle length (1 for a fixed point) and transient is the number of
+generations (since the detector was started) before the cycle was entered
+Call update() after every colony.next_generation(); edits made outside the update rules need reset()
+'''
+class CycleDetector:
+    def __init__(self, colony, max_period=64):
+        self.colony = colony
+        self.max_period = max_period
+        self.reset()
+
+    # rehashes the colony's current state and forgets the history
+    def reset(self):
+        self.hash = xor_keys(np.flatnonzero(~self.colony.coop))
+        self.start = self.colony.generation
+        self.last = self.start
+        self.seen = {self.hash: self.start}
+        self.history = deque([self.hash])
+
+        self.period = None
+        self.transient = None
+
+    def found(self):
+        return self.period is not None
+
+    '''
+    folds the last generation's flips into the state hash; returns True once a fixed point or a cycle
+    of at most max_period generations has been found
+    '''
+    def update(self):
+        if self.found():
+            return True
+
+        generation = self.colony.generation
+        if generation == self.last:
+            return False        # no new generation since the last update
+        self.last = generation
+        self.hash ^= xor_keys(self.colony.flipped)
+
+        if self.hash in self.seen:
+            first = self.seen[self.hash]
+            self.period = generation - first
+            self.transient = first - self.start
+            return True
+
+        self.seen[self.hash] = generation
+        self.history.append(self.hash)
+        if len(self.history) > self.max_period:
+            del self.seen[self.history.popleft()]
+        return False
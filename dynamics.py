@@ -0,0 +1,98 @@
+# Whole-grid update rules for the Colony
+# Each rule takes the current strategy array (True if coop, False if defect) and returns the next one
+
+from neighborhood import *
+
+'''
+Standard threshold rule
+threshold - the minimum number of defecting neighbors required for a cell to defect
+radius - radius of the square neighborhood that is counted (1 is the 3x3 Moore neighborhood)
+'''
+def threshold_step(coop, threshold, radius=1):
+    def_n = count_neighbors(~coop, radius)
+    return def_n < threshold        # if you have enough defecting neighbors, you defect
+
+'''
+Payoff of every cell from playing against each of its neighbors
+Silent neighbors do not share their opinion, so they add nothing to the payoff
+Params:
+coop - strategy array
+silent - silence map, same shape as coop
+kernel - offset-indexed weights for degrees of influence, see weighting_functions.weight_kernel;
+         its radius is the interaction radius
+payoff - [cc, cd, dc, dd] entries of the 2x2 payoff matrix
+'''
+def payoff_field(coop, silent, kernel, payoff):
+    # weighted number of cooperating and defecting neighbors that are heard
+    w_coop = neighbor_sum(coop & ~silent, kernel)
+    w_defect = neighbor_sum(~coop & ~silent, kernel)
+
+    return np.where(coop,
+                    payoff[0] * w_coop + payoff[1] * w_defect,       # cc, cd
+                    payoff[2] * w_coop + payoff[3] * w_defect)       # dc, dd
+
+'''
+Perfect best response: every cell adopts the strategy of the best-scoring cell within radius
+(including itself). Ties are broken in favour of keeping the current strategy
+Params:
+coop - strategy array
+p_now - payoff of every cell, same shape as coop
+radius - imitation radius
+'''
+def best_response_step(coop, p_now, radius=1):
+    # best payoff seen among cooperators and among defectors around every cell
+    best_coop = neighbor_max(np.where(coop, p_now, -np.inf), radius)
+    best_defect = neighbor_max(np.where(coop, -np.inf, p_now), radius)
+
+    # keep strategy similar to yours if multiple best responses
+    return np.where(coop, best_coop >= best_defect, best_coop > best_defect)
+
+'''
+Irrational best response (Fermi rule): every cell compares itself to one random neighbor within radius
+and adopts its strategy with probability 1 / (1 + exp(-beta * (p_neighbor - p_self)))
+Cells that are too stubborn, or that picked a silent neighbor, keep their strategy
+Params:
+coop - strategy array
+silent - silence map, same shape as coop
+p_now - payoff of every cell, same shape as coop
+beta - rationality
+stubbornness - probability of keeping the current strategy regardless of payoffs
+rng - numpy Generator (anything with random(shape) and integers(n, size=shape)) that draws for the whole grid
+radius - imitation radius
+'''
+def fermi_step(coop, silent, p_now, beta, stubbornness, rng, radius=1):
+    stubborn, pick, q = fermi_draws(rng, coop.shape, stubbornness, radius)
+    return fermi_choice(coop, silent, p_now, beta, stubborn, pick, q, radius)
+
+'''
+all random draws of a Fermi generation at once, in the order fermi_step makes them
+returns (stubborn, pick, q): who keeps their strategy regardless, which neighbor (an index into
+square_offsets(radius)) every cell compares itself to, and the uniform numbers the switch probabilities are met with
+'''
+def fermi_draws(rng, shape, stubbornness, radius=1):
+    stubborn = rng.random(shape) < stubbornness
+    pick = rng.integers(len(square_offsets(radius)), size=shape)
+    q = rng.random(shape)
+    return stubborn, pick, q
+
+'''
+Fermi rule applied with given draws (see fermi_draws); the draws may be windows cut from whole-grid draws
+'''
+def fermi_choice(coop, silent, p_now, beta, stubborn, pick, q, radius=1):
+    rows, columns = coop.shape[-2:]
+    offsets = np.array(square_offsets(radius))
+
+    # flat index of every cell's randomly picked neighbor on the torus
+    nr = (np.arange(rows)[:, None] + offsets[pick, 0]) % rows
+    nc = (np.arange(columns)[None, :] + offsets[pick, 1]) % columns
+    flat = (nr * columns + nc).reshape(coop.shape[:-2] + (rows * columns,))
+
+    def neighbor(grid):
+        flat_grid = grid.reshape(grid.shape[:-2] + (rows * columns,))
+        return np.take_along_axis(flat_grid, flat, axis=-1).reshape(coop.shape)
+
+    # numerically stable logistic, same as 1 / (1 + exp(-x)) without overflow
+    prob_of_switch = 0.5 * (1.0 + np.tanh(0.5 * beta * (neighbor(p_now) - p_now)))
+
+    switch = ~stubborn & ~neighbor(silent) & (q < prob_of_switch)
+    return np.where(switch, neighbor(coop), coop)         # adopt neighbor strategy, or keep original
@@ -0,0 +1,106 @@
+# Replica ensembles of a Colony
+# R independent replicas of the same grid are stored as one (R, rows, columns) array and advanced together;
+# the update rules in dynamics.py work on the last two axes, so one batched call steps every replica.
+# Replica i draws the random numbers of its update rules from the streams of run i of settings.seed (see
+# random_streams.py), so it follows a Colony with those streams from the same grid step for step.
+
+from collections import namedtuple
+
+import numpy as np
+from colony import Colony
+from dynamics import *
+from random_streams import RandomStreams
+from weighting_functions import weight_kernel
+
+# per-replica arrays (coop_fraction, changed) and their aggregates after a generation
+EnsembleStats = namedtuple("EnsembleStats", ["generation", "coop_fraction", "changed", "mean_coop_fraction",
+                                             "std_coop_fraction", "total_changed"])
+
+'''
+Random draws for a stack of replicas: every (rows, columns) slice comes from that replica's own generator
+(or draws of a generation, see RandomStreams.at), so a replica's results do not depend on how many other
+replicas run next to it
+'''
+class ReplicaRandom:
+    def __init__(self, generators):
+        self.generators = generators
+
+    def random(self, shape):
+        return np.stack([g.random(shape[1:]) for g in self.generators])
+
+    def integers(self, n, size):
+        return np.stack([g.integers(n, size=size[1:]) for g in self.generators])
+
+class ColonyEnsemble:
+    def __init__(self, replicas, rows, columns, settings):
+        self.replicas = replicas
+        self.rows = rows
+        self.columns = columns
+        self.settings = settings
+
+        self.coop = np.ones((replicas, rows, columns), dtype=bool)
+        self.silent = np.zeros((replicas, rows, columns), dtype=bool)
+
+        # random starting grids, and the random draws of the update rules of every replica
+        seeds = np.random.SeedSequence(settings.seed).spawn(replicas)
+        self.rng = ReplicaRandom([np.random.default_rng(s) for s in seeds])
+        self.streams = [RandomStreams(settings.seed, run) for run in range(replicas)]
+
+        self.generation = 0
+
+    # starts every replica from the same preset, (r,c) coordinates of central pixel
+    def apply_preset(self, name, r, c):
+        colony = Colony(self.rows, self.columns, 1, self.settings)
+        colony.apply_preset(name, r, c)
+        self.coop[:] = colony.coop
+
+    # independent random defectors in every replica, with the given probability
+    def randomize(self, defect_fraction):
+        self.coop = self.rng.random(self.coop.shape) >= defect_fraction
+
+    # fraction of cells that cooperate, per replica
+    def coop_fraction(self):
+        return np.count_nonzero(self.coop, axis=(1, 2)) / (self.rows * self.columns)
+
+    '''
+    advances every replica by one generation with the rule named by settings.next_gen_type
+    returns an EnsembleStats with per-replica and aggregate statistics of the new generation
+    '''
+    def next_generation(self):
+        settings = self.settings
+        rule = settings.next_gen_type
+
+        if rule == "Threshold":
+            lnext = threshold_step(self.coop, settings.threshold, settings.interaction_radius)
+
+        elif rule in ("Perfect Best Response", "Irrational Best Response"):
+            rng = ReplicaRandom([streams.at(self.generation) for streams in self.streams])
+
+            # update silent instances if necessary
+            if settings.silence != 0:
+                self.silent = rng.random(self.coop.shape) <= settings.silence
+            else:
+                self.silent[:] = False
+
+            kernel = weight_kernel(settings.weight_func, settings.interaction_radius)
+            p_now = payoff_field(self.coop, self.silent, kernel, settings.payoff)
+
+            if rule == "Irrational Best Response":
+                lnext = fermi_step(self.coop, self.silent, p_now, settings.beta, settings.stubbornness,
+                                   rng, settings.imitation_radius)
+            else:
+                lnext = best_response_step(self.coop, p_now, settings.imitation_radius)
+                if settings.silence != 0 or settings.stubbornness != 0:     # same draws as Colony
+                    rand = rng.random(self.coop.shape)
+                    lnext = np.where(rand < settings.stubbornness, self.coop, lnext)   # too stubborn to switch
+
+        else:
+            raise ValueError("Unrecognized update function: " + str(rule))
+
+        changed = np.count_nonzero(lnext != self.coop, axis=(1, 2))
+        self.coop = lnext
+        self.generation += 1
+
+        coop_fraction = self.coop_fraction()
+        return EnsembleStats(self.generation, coop_fraction, changed, coop_fraction.mean(), coop_fraction.std(),
+                             int(changed.sum()))
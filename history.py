@@ -0,0 +1,153 @@
+# Bounded in-memory history of a Colony, for rewinding
+# Every recorded state is stored as the cells that flipped since the previous one; every so often the whole
+# grid is kept as well (bit-packed), so any state is at most keyframe_every flips away from a full copy.
+# When the stored arrays outgrow the memory budget the oldest states are dropped.
+# Recording and reading may happen on different threads.
+
+from collections import deque
+import threading
+
+import numpy as np
+
+HISTORY_BUDGET = 64 * 2 ** 20       # bytes
+KEYFRAME_EVERY = 64
+
+'''
+one recorded state
+flips - flat indices of the cells that differ from the previous state (None for the oldest state)
+keyframe - bit-packed copy of the whole grid, or None
+'''
+class Snapshot:
+    __slots__ = ["generation", "flips", "keyframe"]
+
+    def __init__(self, generation, flips, keyframe):
+        self.generation = generation
+        self.flips = flips
+        self.keyframe = keyframe
+
+    def nbytes(self):
+        return (0 if self.flips is None else self.flips.nbytes) + (0 if self.keyframe is None else self.keyframe.nbytes)
+
+class History:
+    def __init__(self, budget=HISTORY_BUDGET, keyframe_every=KEYFRAME_EVERY):
+        self.budget = budget
+        self.keyframe_every = keyframe_every
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.snapshots = deque()
+            self.shape = None
+            self.nbytes = 0
+            self.since_keyframe = 0         # snapshots and flip bytes since the last keyframe
+            self.flip_bytes = 0
+            self.cursor = None              # (index, grid) of the last state() call, to walk from
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def generation(self, i):
+        return self.snapshots[i].generation
+
+    def pack(self, grid):
+        return np.packbits(grid.reshape(-1))
+
+    def unpack(self, keyframe):
+        return np.unpackbits(keyframe, count=self.shape[0] * self.shape[1]).astype(bool).reshape(self.shape)
+
+    '''
+    appends the colony's current state
+    flipped - cells that changed since the last recorded state, if known (e.g. Colony.flipped after a step);
+              otherwise they are found by comparing with the last state
+    '''
+    def record(self, coop, generation, flipped=None):
+        with self.lock:
+            if coop.shape != self.shape:
+                self.clear()
+                self.shape = coop.shape
+                flipped = None          # the first state is always a keyframe
+            elif flipped is None:
+                flipped = np.flatnonzero(coop != self.state(len(self.snapshots) - 1))
+
+            if self.snapshots and len(flipped) == 0 and generation == self.snapshots[-1].generation:
+                return          # nothing new
+
+            flips = None if flipped is None else flipped.astype(np.int32)
+            self.since_keyframe += 1
+            self.flip_bytes += 0 if flips is None else flips.nbytes
+            keyframe = None
+            if flips is None or self.since_keyframe >= self.keyframe_every or self.flip_bytes > coop.size // 8:
+                keyframe = self.pack(coop)
+                self.since_keyframe = 0
+                self.flip_bytes = 0
+
+            snapshot = Snapshot(generation, flips, keyframe)
+            self.snapshots.append(snapshot)
+            self.nbytes += snapshot.nbytes()
+            self.cursor = None
+            self.evict()
+
+    # drops the oldest states until the history fits its budget; the new oldest state becomes a keyframe
+    def evict(self):
+        while self.nbytes > self.budget and len(self.snapshots) > 1:
+            oldest = self.snapshots.popleft()
+            grid = self.unpack(oldest.keyframe)
+            self.nbytes -= oldest.nbytes()
+
+            first = self.snapshots[0]
+            self.nbytes -= first.nbytes()
+            if first.keyframe is None:
+                grid.reshape(-1)[first.flips] ^= True
+                first.keyframe = self.pack(grid)
+            first.flips = None
+            self.nbytes += first.nbytes()
+
+    '''
+    strategy grid of the i-th recorded state (a new array); walks from the nearest keyframe, or from the
+    last state asked for when that is closer, so scrubbing through neighbouring states is cheap
+    '''
+    def state(self, i):
+        with self.lock:
+            if i < 0:
+                i += len(self.snapshots)
+            k = i
+            while self.snapshots[k].keyframe is None:
+                k -= 1
+
+            if self.cursor is not None and abs(self.cursor[0] - i) < i - k:
+                j, grid = self.cursor[0], self.cursor[1].copy()
+            else:
+                j, grid = k, self.unpack(self.snapshots[k].keyframe)
+
+            flat = grid.reshape(-1)
+            while j < i:
+                j += 1
+                flat[self.snapshots[j].flips] ^= True
+            while j > i:
+                flat[self.snapshots[j].flips] ^= True
+                j -= 1
+
+            self.cursor = (i, grid.copy())
+            return grid
+
+    '''
+    forgets every state after the i-th, which becomes the latest one again
+    returns (generation, grid) of that state
+    '''
+    def truncate(self, i):
+        with self.lock:
+            if i < 0:
+                i += len(self.snapshots)
+            grid = self.state(i)
+            while len(self.snapshots) > i + 1:
+                self.nbytes -= self.snapshots.pop().nbytes()
+
+            self.since_keyframe = 0
+            self.flip_bytes = 0
+            for snapshot in reversed(self.snapshots):
+                if snapshot.keyframe is not None:
+                    break
+                self.since_keyframe += 1
+                self.flip_bytes += snapshot.flips.nbytes
+            return self.snapshots[i].generation, grid
@@ -0,0 +1,141 @@
+# Neighborhood helpers for the Colony torus
+# Every helper works on whole grids at once; the last two axes are (rows, columns) and wrap around
+
+import numpy as np
+
+# kernels with at least this many non-zero weights are applied with the FFT instead of shifted sums
+FFT_MIN_TAPS = 16
+
+# boolean grids under FFT kernels with at most this many distinct weights are counted exactly, one weight at a time
+FFT_MAX_LEVELS = 8
+
+'''
+(dr, dc) offsets of the square (Moore) neighborhood of the given radius, excluding the central pixel
+'''
+def square_offsets(radius):
+    return [(dr, dc) for dr in range(-radius, radius + 1) for dc in range(-radius, radius + 1)
+            if dr != 0 or dc != 0]
+
+'''
+Pads the last two axes of grid with wrapped copies of the opposite edges, so that
+padded[..., radius + r + dr, radius + c + dc] is the (r + dr, c + dc) neighbor on the torus
+'''
+def wrap_pad(grid, radius):
+    pad = [(0, 0)] * (grid.ndim - 2) + [(radius, radius), (radius, radius)]
+    return np.pad(grid, pad, mode="wrap")
+
+'''
+Counts, for every cell at once, how many of its neighbors within radius are True on the torus
+Params:
+grid - boolean array, last two axes are (rows, columns)
+radius - radius of the square neighborhood (1 is the 3x3 Moore neighborhood)
+'''
+def count_neighbors(grid, radius=1):
+    n = (2 * radius + 1) ** 2 - 1
+    dtype = np.uint8 if n < 256 else np.int32
+
+    if n >= FFT_MIN_TAPS:
+        kernel = np.ones((2 * radius + 1, 2 * radius + 1))
+        kernel[radius, radius] = 0
+        return np.rint(fft_neighbor_sum(grid, kernel)).astype(dtype)
+
+    rows, columns = grid.shape[-2:]
+    padded = wrap_pad(grid, radius)
+
+    counts = np.zeros(grid.shape, dtype=dtype)
+    for dr, dc in square_offsets(radius):
+        counts += padded[..., radius + dr:radius + dr + rows, radius + dc:radius + dc + columns]
+    return counts
+
+'''
+Weighted neighbor sum of every cell on the torus
+out[r, c] = sum over (dr, dc) of kernel[radius + dr, radius + dc] * grid[r + dr, c + dc]
+Small kernels are summed directly, large ones through the FFT so the cost does not grow with the radius
+Params:
+grid - array, last two axes are (rows, columns)
+kernel - (2 * radius + 1) x (2 * radius + 1) array of weights, indexed by offset
+'''
+def neighbor_sum(grid, kernel):
+    if np.count_nonzero(kernel) >= FFT_MIN_TAPS:
+        levels = np.unique(kernel[kernel != 0])
+        if grid.dtype == bool and len(levels) <= FFT_MAX_LEVELS:
+            return fft_level_sum(grid, kernel, levels)
+        return fft_neighbor_sum(grid, kernel)
+
+    radius = kernel.shape[0] // 2
+    rows, columns = grid.shape[-2:]
+    padded = wrap_pad(grid, radius)
+
+    total = np.zeros(grid.shape)
+    term = np.empty(grid.shape)
+    for dr in range(-radius, radius + 1):
+        for dc in range(-radius, radius + 1):
+            alpha = kernel[radius + dr, radius + dc]
+            if alpha != 0:
+                np.multiply(padded[..., radius + dr:radius + dr + rows, radius + dc:radius + dc + columns],
+                            alpha, out=term)
+                total += term
+    return total
+
+# transformed kernels, keyed by (kernel bytes, kernel shape, grid shape)
+_fft_kernels = {}
+
+'''
+Spreads an offset-indexed kernel over a rows x columns torus and transforms it
+Offsets that wrap onto the same cell (radius >= half the grid) add up, as in the direct sum
+'''
+def fft_kernel(kernel, rows, columns):
+    key = (kernel.tobytes(), kernel.shape, rows, columns)
+    if key not in _fft_kernels:
+        if len(_fft_kernels) >= 32:
+            _fft_kernels.clear()
+        radius = kernel.shape[0] // 2
+        offsets = np.arange(-radius, radius + 1)
+        spread = np.zeros((rows, columns))
+        np.add.at(spread, ((-offsets[:, None]) % rows, (-offsets[None, :]) % columns), kernel)
+        _fft_kernels[key] = np.fft.rfft2(spread)
+    return _fft_kernels[key]
+
+'''
+Same as neighbor_sum, computed as a circular convolution in O(N log N) regardless of the radius
+'''
+def fft_neighbor_sum(grid, kernel):
+    rows, columns = grid.shape[-2:]
+    transformed = np.fft.rfft2(grid.astype(float)) * fft_kernel(kernel, rows, columns)
+    return np.fft.irfft2(transformed, s=(rows, columns))
+
+'''
+Weighted neighbor sum of a boolean grid through the FFT, without round-off in the result
+The neighbors are counted exactly (rounded to integers) separately for every distinct weight and
+then combined, so cells with the same neighborhood get bit-for-bit the same sum, wherever they are
+and whatever window of the grid is transformed; best response relies on exact payoff ties
+'''
+def fft_level_sum(grid, kernel, levels):
+    rows, columns = grid.shape[-2:]
+    transformed = np.fft.rfft2(grid.astype(float))
+
+    total = np.zeros(grid.shape)
+    for weight in levels:
+        counts = np.fft.irfft2(transformed * fft_kernel((kernel == weight).astype(float), rows, columns),
+                               s=(rows, columns))
+        total += weight * np.rint(counts)
+    return total
+
+'''
+Largest value within radius of every cell (including the cell itself) on the torus
+The square window is separable, so rows and columns are reduced one after the other
+'''
+def neighbor_max(grid, radius=1):
+    rows, columns = grid.shape[-2:]
+    pad = [(0, 0)] * (grid.ndim - 2)
+
+    padded = np.pad(grid, pad + [(radius, radius), (0, 0)], mode="wrap")
+    row_max = grid.copy()
+    for dr in range(-radius, radius + 1):
+        np.maximum(row_max, padded[..., radius + dr:radius + dr + rows, :], out=row_max)
+
+    padded = np.pad(row_max, pad + [(0, 0), (radius, radius)], mode="wrap")
+    out = row_max.copy()
+    for dc in range(-radius, radius + 1):
+        np.maximum(out, padded[..., radius + dc:radius + dc + columns], out=out)
+    return out
@@ -0,0 +1,248 @@
+# Bit-packed Colony storage for very large grids
+# Strategy and silence take one bit per cell, packed little-endian into 64-bit words along each row:
+# bit j of word w in a row is column 64 * w + j. Bits past the last column are kept at zero.
+# The threshold rule runs directly on the words with bit-sliced neighbor counting, 64 cells per operation.
+
+import itertools
+
+import numpy as np
+from colony import Generation
+
+WORD = np.dtype("<u8")
+WORD_BITS = 64
+
+# rows of words processed at once by the threshold rule, to bound the size of the temporaries
+BAND_ROWS = 1024
+
+ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# number of set bits in every byte value
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+'''
+packs a boolean array (last axis is columns) into rows of 64-bit words
+'''
+def pack_bits(grid):
+    columns = grid.shape[-1]
+    n_words = -(-columns // WORD_BITS)
+    packed = np.packbits(grid, axis=-1, bitorder="little")
+
+    pad = [(0, 0)] * (grid.ndim - 1) + [(0, n_words * 8 - packed.shape[-1])]
+    return np.ascontiguousarray(np.pad(packed, pad)).view(WORD)
+
+'''
+unpacks rows of 64-bit words back into a boolean array with the given number of columns
+'''
+def unpack_bits(words, columns):
+    grid = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1, bitorder="little")
+    return grid[..., :columns].astype(bool)
+
+'''
+mask of the valid bits of the last word of every row
+'''
+def last_word_mask(columns):
+    used = columns - (-(-columns // WORD_BITS) - 1) * WORD_BITS
+    return ONES >> np.uint64(WORD_BITS - used)
+
+'''
+east neighbor of every bit on the torus: out[c] = x[c + 1]
+'''
+def shift_east(x, columns):
+    last = np.uint64((columns - 1) % WORD_BITS)
+    out = (x >> np.uint64(1)) | (np.roll(x, -1, axis=-1) << np.uint64(WORD_BITS - 1))
+    out[..., -1] &= last_word_mask(columns)
+    out[..., -1] |= (x[..., 0] & np.uint64(1)) << last        # column 0 wraps onto the last column
+    return out
+
+'''
+west neighbor of every bit on the torus: out[c] = x[c - 1]
+'''
+def shift_west(x, columns):
+    last = np.uint64((columns - 1) % WORD_BITS)
+    out = (x << np.uint64(1)) | (np.roll(x, 1, axis=-1) >> np.uint64(WORD_BITS - 1))
+    out[..., 0] &= ~np.uint64(1)
+    out[..., 0] |= (x[..., -1] >> last) & np.uint64(1)        # the last column wraps onto column 0
+    out[..., -1] &= last_word_mask(columns)
+    return out
+
+def full_add(a, b, c):
+    half = a ^ b
+    return half ^ c, (a & b) | (c & half)
+
+'''
+bit-sliced count of the set bits among 8 planes, as 4 bit planes (ones, twos, fours, eights)
+'''
+def count8(planes):
+    s1, c1 = full_add(planes[0], planes[1], planes[2])
+    s2, c2 = full_add(planes[3], planes[4], planes[5])
+    s3, c3 = planes[6] ^ planes[7], planes[6] & planes[7]
+
+    b0, c4 = full_add(s1, s2, s3)
+    t, c5 = full_add(c1, c2, c3)
+    b1, c6 = t ^ c4, t & c4
+    return b0, b1, c5 ^ c6, c5 & c6
+
+'''
+bit-sliced comparison of a 4-bit count against a constant: set where count >= k
+'''
+def at_least(bits, k):
+    greater = np.zeros_like(bits[0])
+    equal = np.full_like(bits[0], ONES)
+    for i in reversed(range(4)):
+        if (k >> i) & 1:
+            equal &= bits[i]
+        else:
+            greater |= equal & bits[i]
+            equal &= ~bits[i]
+    return greater | equal
+
+'''
+Standard threshold rule on packed words (3x3 Moore neighborhood on the torus)
+threshold - the minimum number of defecting neighbors required for a cell to defect
+'''
+def packed_threshold_step(coop, columns, threshold):
+    rows = coop.shape[0]
+    k = int(np.ceil(threshold))
+    if k <= 0:
+        return np.zeros_like(coop)            # everybody has enough defecting neighbors
+
+    valid = np.full(coop.shape[1], ONES)
+    valid[-1] = last_word_mask(columns)
+    lnext = np.empty_like(coop)
+
+    for r0 in range(0, rows, BAND_ROWS):
+        r1 = min(r0 + BAND_ROWS, rows)
+
+        # band of defectors plus one wrapped row above and below
+        band = ~np.take(coop, np.arange(r0 - 1, r1 + 1) % rows, axis=0) & valid
+        east = shift_east(band, columns)
+        west = shift_west(band, columns)
+
+        planes = []
+        for grid in (band, east, west):
+            planes.append(grid[:-2])        # row above
+            planes.append(grid[2:])         # row below
+        planes.append(east[1:-1])
+        planes.append(west[1:-1])
+
+        defect = at_least(count8(planes), k) if k <= 8 else np.zeros_like(planes[0])
+        lnext[r0:r1] = ~defect & valid      # if you have enough defecting neighbors, you defect
+    return lnext
+
+'''
+Colony whose strategy and silence maps are stored one bit per cell
+Only the threshold rule with the 3x3 neighborhood (interaction radius 1) is supported; presets, single cells,
+saving and loading work on the packed words
+'''
+class PackedColony:
+    def __init__(self, rows, columns, cell_size, settings):
+        self.rows = rows
+        self.columns = columns
+        self.cell_size = cell_size
+        self.settings = settings
+
+        self.coop = np.full((rows, -(-columns // WORD_BITS)), ONES, dtype=WORD)     # everybody cooperates
+        self.coop[:, -1] = last_word_mask(columns)
+        self.silent = np.zeros_like(self.coop)
+
+        self.rng = np.random.default_rng(settings.seed)
+        self.generation = 0
+
+    # single cells on the torus
+    def get_coop(self, r, c):
+        r %= self.rows
+        c %= self.columns
+        return bool((self.coop[r, c // WORD_BITS] >> np.uint64(c % WORD_BITS)) & np.uint64(1))
+
+    def set_coop(self, r, c, value):
+        r %= self.rows
+        c %= self.columns
+        bit = np.uint64(1) << np.uint64(c % WORD_BITS)
+        if value:
+            self.coop[r, c // WORD_BITS] |= bit
+        else:
+            self.coop[r, c // WORD_BITS] &= ~bit
+
+    def flip(self, r, c):
+        self.set_coop(r, c, not self.get_coop(r, c))
+
+    # boolean strategy array of rows r0 to r1 (the whole grid by default)
+    def unpack(self, r0=0, r1=None):
+        return unpack_bits(self.coop[r0:r1], self.columns)
+
+    # fraction of cells that cooperate
+    def coop_fraction(self):
+        return int(POPCOUNT8[self.coop.view(np.uint8)].sum(dtype=np.int64)) / (self.rows * self.columns)
+
+    def next_generation_threshold(self):
+        self.coop = packed_threshold_step(self.coop, self.columns, self.settings.threshold)
+
+    '''
+    computes the next generation (threshold rule with interaction radius 1 only); returns the number of cells
+    that changed strategy
+    '''
+    def next_generation(self):
+        if self.settings.next_gen_type != "Threshold":
+            raise ValueError("Packed colonies only support the Threshold rule, not " + str(self.settings.next_gen_type))
+        if self.settings.interaction_radius != 1:
+            raise ValueError("Packed colonies only support interaction radius 1, not "
+                             + str(self.settings.interaction_radius))
+
+        before = self.coop
+        self.next_generation_threshold()
+        self.generation += 1
+        return int(POPCOUNT8[(before ^ self.coop).view(np.uint8)].sum(dtype=np.int64))
+
+    # same as Colony.generations(); the state is a read-only view of the packed words
+    def generations(self, n=None, state=False):
+        steps = itertools.count() if n is None else range(n)
+        for _ in steps:
+            changed = self.next_generation()
+            view = None
+            if state:
+                view = self.coop.view()
+                view.flags.writeable = False
+            yield Generation(self.generation, changed, self.coop_fraction(), view)
+
+    # random defectors with the given probability, drawn a band of rows at a time
+    def randomize(self, defect_fraction):
+        for r0 in range(0, self.rows, BAND_ROWS):
+            r1 = min(r0 + BAND_ROWS, self.rows)
+            self.coop[r0:r1] = pack_bits(self.rng.random((r1 - r0, self.columns)) >= defect_fraction)
+
+    # Presets
+    # (r,c) coordinates of central pixel; name is one of colony.PRESETS
+    def apply_preset(self, name, r, c):
+        self.coop[:] = ONES
+        self.coop[:, -1] = last_word_mask(self.columns)
+
+        if name == "All Cooperators":
+            defectors = []
+        elif name == "von Neumann":
+            defectors = [(0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)]
+        elif name == "3x3 Defectors":
+            defectors = [(dr, dc) for dr in range(-1, 2) for dc in range(-1, 2)]
+        elif name == "5x5 Defectors":
+            defectors = [(dr, dc) for dr in range(-2, 3) for dc in range(-2, 3)]
+        else:
+            raise ValueError("Unrecognized preset: " + str(name))
+
+        for (dr, dc) in defectors:
+            self.set_coop(r + dr, c + dc, False)
+
+    # saves the packed words as they are (.npz)
+    def save(self, path):
+        np.savez(path, coop=self.coop, silent=self.silent, shape=np.array([self.rows, self.columns]),
+                 generation=np.array(self.generation))
+
+'''
+loads a colony written by PackedColony.save
+'''
+def load_packed_colony(path, cell_size, settings):
+    with np.load(path) as data:
+        rows, columns = (int(n) for n in data["shape"])
+        colony = PackedColony(rows, columns, cell_size, settings)
+        colony.coop = data["coop"].astype(WORD)
+        colony.silent = data["silent"].astype(WORD)
+        colony.generation = int(data["generation"])
+    return colony
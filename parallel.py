@@ -0,0 +1,303 @@
+# Domain-decomposed stepping of a Colony over worker processes
+# The torus is cut into bands of whole tile rows, one per worker process. The strategy grid, the silence map
+# and the flipped cells live in shared memory: the colony's own arrays become views of it, so edits made
+# through the colony are seen by the workers. Every generation each worker reads its band plus the halo rows
+# above and below it (the edges of the neighboring bands, wrapped around the torus) and computes its next
+# band; a barrier makes sure every halo has been read before any band is overwritten. The workers then
+# report their flipped cells and the main process waits for all of them.
+# The rules see the same padded windows as in Colony.update_active, so deterministic rules give exactly the
+# generations of serial stepping, including the sparse updates of quiet grids (only the live tiles of every
+# band are recomputed). Stochastic rules draw the random numbers of every band (and of its halo) in its
+# worker from colony.streams, which give every cell the same numbers wherever it is drawn, so they match
+# serial stepping too.
+# With the phase timer on, the workers time the phases of the rule themselves; a step records those of its
+# slowest band, and "bands" is the rest of the time spent waiting for and writing back the bands.
+
+import multiprocessing
+import os
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+from dynamics import *
+from weighting_functions import weight_kernel
+from timing import PhaseTimer, phase_timer
+
+'''
+a named shared-memory array: created in the main process, attached to by name in the workers
+'''
+class SharedArray:
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    # what a worker needs to attach to the array
+    def spec(self):
+        return (self.memory.name, self.shape, self.dtype.str)
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
+
+'''
+Steps a Colony with its grid cut into bands, one per worker process
+Attaching sets colony.stepper, so colony.next_generation() (and generations(), run_colony, the GUI worker)
+go through the workers until close(). Use it as a context manager, e.g.
+    with ParallelStepper(hive, 8):
+        for g in hive.generations(1000): ...
+workers - number of processes (default: one per available core), at most one per tile row of the grid
+'''
+class ParallelStepper:
+    def __init__(self, colony, workers=None):
+        self.colony = colony
+        self.rows = colony.rows
+        self.columns = colony.columns
+        shape = (self.rows, self.columns)
+
+        # bands are whole rows of the colony's active tiles, so every live run belongs to one band
+        tile = colony.active.tile
+        tile_rows = colony.active.shape[0]
+        workers = min(workers or worker_count(), tile_rows)
+        bounds = [min(tile_rows * i // workers * tile, self.rows) for i in range(workers + 1)]
+        self.bands = list(zip(bounds[:-1], bounds[1:]))
+
+        self.coop = SharedArray(shape, bool)
+        self.silent = SharedArray(shape, bool)
+        self.flips = SharedArray((self.rows * self.columns,), np.intp)
+        self.coop.array[:] = colony.coop
+        self.silent.array[:] = colony.silent
+        self.attach()
+
+        context = multiprocessing.get_context()
+        self.barrier = context.Barrier(workers)
+        self.pipes = []
+        self.processes = []
+        for band in self.bands:
+            here, there = context.Pipe()
+            process = context.Process(target=band_worker, daemon=True,
+                                      args=(there, band, shape, self.coop.spec(), self.silent.spec(),
+                                            self.flips.spec(), self.barrier))
+            process.start()
+            self.pipes.append(here)
+            self.processes.append(process)
+        colony.stepper = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # makes the colony's strategy and silence arrays views of the shared ones
+    def attach(self):
+        self.colony._coop = self.coop.array
+        self.colony.silent = self.silent.array
+
+    # brings arrays the colony replaced since the last step (new grids, reset()) back into shared memory
+    def sync(self):
+        if self.colony._coop is not self.coop.array:
+            self.coop.array[:] = self.colony._coop
+        if self.colony.silent is not self.silent.array:
+            self.silent.array[:] = self.colony.silent
+        self.attach()
+
+    '''
+    computes the next generation of the colony with the rule named by settings.next_gen_type, the same way
+    Colony.next_generation would; Colony.next_generation calls this and counts the generation
+    '''
+    def step(self):
+        colony = self.colony
+        settings = colony.settings
+        rule = settings.next_gen_type
+        lap = phase_timer.start()
+        self.sync()
+
+        if rule == "Threshold":
+            spec = ("Threshold", settings.threshold, settings.interaction_radius)
+            halo = settings.interaction_radius
+            key = ("Threshold", settings.threshold, settings.interaction_radius)
+
+        elif rule in ("Perfect Best Response", "Irrational Best Response"):
+            if settings.silence == 0:
+                self.silent.array[:] = False        # the workers draw and write back the silence map otherwise
+
+            kernel = weight_kernel(settings.weight_func, settings.interaction_radius)
+            payoff = list(settings.payoff)
+            radius = settings.imitation_radius
+            halo = settings.interaction_radius + radius
+            spec = (rule, kernel, payoff, radius, settings.silence, settings.stubbornness, settings.beta,
+                    colony.streams, colony.generation)
+            key = None          # stochastic, every cell is live
+            if rule == "Perfect Best Response" and settings.silence == 0 and settings.stubbornness == 0:
+                key = ("Perfect Best Response", tuple(payoff), settings.weight_func, settings.interaction_radius,
+                       radius)
+
+        else:
+            raise ValueError("Unrecognized update function: " + str(rule))
+
+        # deterministic rules only recompute the live tiles, as in Colony.update_active
+        live = None
+        if key is None:
+            colony.rule_key = None
+        else:
+            if key != colony.rule_key:
+                colony.rule_key = key
+                colony.active.mark_all()
+            live = colony.active.live(halo)
+        runs = [None if live is None else [] for band in self.bands]
+        if live is not None:
+            starts = [r0 for (r0, r1) in self.bands]
+            for run in colony.active.runs(live):
+                runs[np.searchsorted(starts, run[0], side="right") - 1].append(run)
+        lap.lap("tiles")
+
+        for pipe, band_runs in zip(self.pipes, runs):
+            pipe.send((spec, halo, band_runs, phase_timer.enabled))
+        replies = self.collect()
+        counts = [count for count, phases in replies]
+        slowest = max((phases for count, phases in replies), key=lambda phases: sum(phases.values()))
+        for phase, seconds in slowest.items():
+            phase_timer.add(phase, seconds)
+        lap.lap("bands", inside=sum(slowest.values()))
+
+        flat = self.flips.array
+        colony.flipped = np.concatenate([flat[r0 * self.columns:r0 * self.columns + n]
+                                         for (r0, r1), n in zip(self.bands, counts)])
+        colony.active.record(colony.flipped)
+        colony.count_flips()
+        if len(colony.flipped):
+            colony.notify()
+        lap.lap("commit")
+
+    # waits for every band of the step; a failed worker breaks the barrier so the others give up too
+    def collect(self):
+        replies = [pipe.recv() for pipe in self.pipes]
+        errors = [reply for reply in replies if isinstance(reply, str)]
+        if errors:
+            self.barrier.reset()
+            raise RuntimeError("Parallel step failed in a worker:\n" + errors[0])
+        return replies
+
+    '''
+    stops the workers and frees the shared memory; the colony keeps private copies of its arrays and
+    steps serially again
+    '''
+    def close(self):
+        if self.colony.stepper is not self:
+            return
+        for pipe in self.pipes:
+            pipe.send(None)
+        for process in self.processes:
+            process.join()
+
+        self.sync()
+        self.colony._coop = self.coop.array.copy()
+        self.colony.silent = self.silent.array.copy()
+        self.colony.stepper = None
+        for shared in [self.coop, self.silent, self.flips]:
+            shared.unlink()
+
+def worker_count():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+'''
+process that steps one band (rows r0 to r1 - 1) every time it is sent (spec, halo, runs, timed) and answers
+with the number of cells of the band that flipped, written to the shared flips array from offset r0 * columns,
+and the seconds spent in each phase of the rule (empty unless timed)
+runs - live cell ranges (r0, r1, c0, c1) inside the band, or None for the whole band
+'''
+def band_worker(pipe, band, shape, coop_spec, silent_spec, flips_spec, barrier):
+    rows, columns = shape
+    r0, r1 = band
+    attached = [SharedArray(spec[1], spec[2], name=spec[0]) for spec in (coop_spec, silent_spec, flips_spec)]
+    coop, silent, flips = [shared.array for shared in attached]
+
+    while True:
+        message = pipe.recv()
+        if message is None:
+            break
+        try:
+            spec, halo, runs, timed = message
+            timer = PhaseTimer()
+            timer.enable(timed)
+            lap = timer.start()
+
+            # next strategies of every range from the current generation, before anything is written back
+            updates = []
+            for (q0, q1, c0, c1) in ([(r0, r1, 0, columns)] if runs is None else runs):
+                grid_rows = np.arange(q0 - halo, q1 + halo) % rows
+                if c1 - c0 == columns:
+                    # whole rows: the rule wraps the columns itself, only the rows need a halo
+                    window = grid_rows
+                    margin = 0
+                else:
+                    window = np.ix_(grid_rows, np.arange(c0 - halo, c1 + halo) % columns)
+                    margin = halo
+                lnext, drawn = band_rule(spec, coop[window], silent[window], grid_rows, lap)
+                inner = (slice(halo, halo + q1 - q0), slice(margin, margin + c1 - c0))
+                updates.append((q0, c0, lnext[inner], None if drawn is None else drawn[inner]))
+            lap.end_parts()
+            barrier.wait()
+
+            count = 0
+            for (q0, c0, lnext, drawn) in updates:
+                region = (slice(q0, q0 + lnext.shape[0]), slice(c0, c0 + lnext.shape[1]))
+                changed = np.flatnonzero(lnext != coop[region])
+                width = lnext.shape[1]
+                flips[r0 * columns + count:r0 * columns + count + len(changed)] = \
+                    (changed // width + q0) * columns + changed % width + c0
+                count += len(changed)
+                coop[region] = lnext
+                if drawn is not None:
+                    silent[region] = drawn
+            pipe.send((count, {phase: stats.total for phase, stats in timer.phases.items()}))
+        except Exception:
+            barrier.abort()
+            pipe.send(traceback.format_exc())
+
+    for shared in attached:
+        shared.close()
+
+'''
+one generation of the rule described by spec on a window of whole rows of the grid (or a window of a
+deterministic rule), the same calls in the same order as Colony's rules
+grid_rows - the rows of the grid the window covers, for the random draws
+lap - marks the end of the rule's phases with lap.part(), as the rules of Colony.update_active do
+returns the next strategies of the window and its new silence map (None when the rule draws none)
+'''
+def band_rule(spec, coop, silent, grid_rows, lap):
+    if spec[0] == "Threshold":
+        threshold, radius = spec[1:]
+        lnext = threshold_step(coop, threshold, radius)
+        lap.part("rule")
+        return lnext, None
+
+    rule, kernel, payoff, radius, silence, stubbornness, beta, streams, generation = spec
+    rng = streams.at(generation, grid_rows)
+    drawn = None
+    if silence != 0:
+        silent = drawn = rng.random(coop.shape) <= silence
+        lap.part("silence")
+    p_now = payoff_field(coop, silent, kernel, payoff)
+    lap.part("payoff")
+
+    if rule == "Irrational Best Response":
+        lnext = fermi_step(coop, silent, p_now, beta, stubbornness, rng, radius)
+        lap.part("select")
+        return lnext, drawn
+
+    lnext = best_response_step(coop, p_now, radius)
+    if silence != 0 or stubbornness != 0:
+        rand = rng.random(coop.shape)
+        lnext = np.where(rand < stubbornness, coop, lnext)   # too stubborn to switch
+    lap.part("select")
+    return lnext, drawn
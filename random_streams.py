@@ -0,0 +1,75 @@
+# Counter-based random streams for the Colony update rules
+# Every random number of a run is a pure function of (run, generation, draw, cell): the run's key seeds a
+# Philox generator, whose 256-bit counter holds the generation, the draw (the first, second, ... grid of
+# random numbers the rule asks for in that generation) and the position of the cell. Any band or window of
+# the grid can jump straight to its own cells, so a seeded run gets the same numbers whether the grid is
+# drawn at once, band by band in worker processes, or stacked with other replicas, and a generation
+# replayed after a rewind gets its original numbers back.
+
+import numpy as np
+
+# Philox produces four 64-bit words per counter value; one word makes one double
+WORDS_PER_COUNTER = 4
+
+'''
+the random streams of one run
+seed - as settings.seed; None draws a fresh key from the operating system
+run - index of the run among runs with the same seed, e.g. the replica of an ensemble
+'''
+class RandomStreams:
+    def __init__(self, seed=None, run=0):
+        entropy = np.random.SeedSequence(seed).entropy
+        self.seed = seed
+        self.run = run
+        self.key = np.random.SeedSequence(entropy, spawn_key=(run,)).generate_state(2, np.uint64)
+
+    '''
+    uniform numbers in [0, 1) of cells start to start + count - 1 (flat indices) for one draw of a generation
+    '''
+    def uniform(self, generation, draw, start, count):
+        bits = np.random.Philox(counter=[0, 0, draw, generation], key=self.key)
+        bits.advance(start // WORDS_PER_COUNTER)
+        skip = start % WORDS_PER_COUNTER
+        return np.random.Generator(bits).random(skip + count)[skip:]
+
+    '''
+    a numpy Generator for draws that are not tied to cells (e.g. the events of asynchronous updates), as the
+    stream of one draw of a generation
+    '''
+    def generator(self, generation, draw):
+        return np.random.Generator(np.random.Philox(counter=[0, 0, draw, generation], key=self.key))
+
+    '''
+    the draws of one generation, through the random(shape) / integers(n, size) interface of a numpy Generator
+    rows - grid rows (absolute indices, wrapping around) of a window of whole rows; None for the whole grid
+    '''
+    def at(self, generation, rows=None):
+        return GenerationRandom(self, generation, rows)
+
+'''
+Random draws of one generation of a run; the n-th call draws from the n-th draw of the generation, so the
+update rules make their calls in the same order wherever they run
+Shapes are (rows, columns) with all the columns of the grid
+'''
+class GenerationRandom:
+    def __init__(self, streams, generation, rows=None):
+        self.streams = streams
+        self.generation = generation
+        self.rows = rows
+        self.draws = 0
+
+    def random(self, shape):
+        rows, columns = shape
+        grid_rows = np.arange(rows) if self.rows is None else np.asarray(self.rows)
+        draw = self.draws
+        self.draws += 1
+
+        # one jump per run of consecutive grid rows (a wrapped window has at most three)
+        breaks = np.flatnonzero(np.diff(grid_rows) != 1) + 1
+        parts = [self.streams.uniform(self.generation, draw, int(run[0]) * columns, len(run) * columns)
+                 for run in np.split(grid_rows, breaks)]
+        return np.concatenate(parts).reshape(rows, columns)
+
+    # integers in [0, n), one uniform number per cell
+    def integers(self, n, size):
+        return np.minimum((self.random(size) * n).astype(np.int64), n - 1)
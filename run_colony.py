@@ -0,0 +1,263 @@
+# Command-line batch runner for the Colony
+# Runs any of the update rules for a fixed number of generations without the GUI, e.g.
+#   python run_colony.py --rows 512 --columns 512 --rule pbr --preset "5x5 Defectors" -n 1000 --out final.npy
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from asynchronous import *
+from clusters import *
+from colony import *
+from cycle_detector import *
+from packed_colony import *
+from parallel import *
+from trajectory import *
+from timing import phase_timer
+from colonyParams import *
+from weighting_functions import *
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run a spatial game colony for N generations without the GUI")
+    parser.add_argument("--params", help="JSON file of ColonyParams values; flags below override it")
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("-n", "--generations", type=int, default=100)
+    parser.add_argument("--rule", choices=list(RULE_ALIASES) + UPDATE_RULES,
+                        help="update rule (default: the params file's next_gen_type, else pbr)")
+
+    parser.add_argument("--threshold", type=float)
+    parser.add_argument("--payoff", type=float, nargs=4, metavar=("CC", "CD", "DC", "DD"))
+    parser.add_argument("--stubbornness", type=float)
+    parser.add_argument("--silence", type=float)
+    parser.add_argument("--beta", type=float)
+    parser.add_argument("--weight", choices=list(WEIGHT_FUNCTIONS), help="weighting function")
+    parser.add_argument("--interaction-radius", type=int)
+    parser.add_argument("--imitation-radius", type=int)
+    parser.add_argument("--seed", type=int)
+
+    parser.add_argument("--preset", choices=PRESETS, help="initial grid formation, centred on the grid")
+    parser.add_argument("--defect-fraction", type=float,
+                        help="start from random defectors with this probability instead of a preset")
+
+    parser.add_argument("--packed", action="store_true",
+                        help="store the grid one bit per cell (Threshold rule, interaction radius 1 only), for very "
+                             "large grids")
+
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="step the colony in N processes, each owning a band of rows (see parallel.py); "
+                             "0 for one per core")
+    parser.add_argument("--schedule", choices=list(SCHEDULE_ALIASES) + SCHEDULES,
+                        help="update one cell at a time instead of the whole grid at once, with a generation "
+                             "as one unit of time (see asynchronous.py)")
+
+    parser.add_argument("--stop-on-cycle", type=int, nargs="?", const=64, default=0, metavar="MAX_PERIOD",
+                        help="stop once a deterministic rule reaches a fixed point or a cycle of at most "
+                             "MAX_PERIOD generations (default 64)")
+
+    parser.add_argument("--record", metavar="PATH",
+                        help="write every generation to a trajectory file (see trajectory.py); an existing "
+                             "file is continued: the run starts from its last generation")
+    parser.add_argument("--keyframe-every", type=int, default=KEYFRAME_EVERY, metavar="K",
+                        help="full grid stored every K generations of the trajectory, flips in between")
+
+    parser.add_argument("--clusters", metavar="PATH",
+                        help="write the cluster statistics of both strategies after every generation to PATH, "
+                             "one JSON object per line")
+    parser.add_argument("--connectivity", type=int, choices=[4, 8], default=4,
+                        help="neighbors that join cells into a cluster (default 4: edges only)")
+
+    parser.add_argument("--timing", action="store_true",
+                        help="time the phases of every update (silence, payoff, select, commit, ...) and print "
+                             "a summary at the end")
+
+    parser.add_argument("--report-every", type=int, default=0, metavar="K",
+                        help="print a summary every K generations (0: only at the end)")
+    parser.add_argument("--out", help="save the final strategy grid (.npy, .npz for the packed words of --packed, "
+                                      "or 0/1 text for any other extension)")
+    return parser.parse_args(argv)
+
+'''
+builds ColonyParams from the params file (if any) and the command-line flags
+'''
+def build_settings(args):
+    settings = ColonyParams()
+    settings.weight_func = uniform_w
+    settings.next_gen_type = "Perfect Best Response"
+    if args.params:
+        settings.load(args.params)
+
+    flags = {"threshold": args.threshold,
+             "payoff": args.payoff,
+             "stubbornness": args.stubbornness,
+             "silence": args.silence,
+             "beta": args.beta,
+             "weight_func": args.weight,
+             "interaction_radius": args.interaction_radius,
+             "imitation_radius": args.imitation_radius,
+             "seed": args.seed,
+             "preset": args.preset}
+    settings.update({name: value for name, value in flags.items() if value is not None})
+
+    if args.rule:
+        settings.next_gen_type = RULE_ALIASES.get(args.rule, args.rule)
+    return settings
+
+def build_colony(args, settings):
+    if args.packed:
+        hive = PackedColony(args.rows, args.columns, 1, settings)
+        if args.defect_fraction is not None:
+            hive.randomize(args.defect_fraction)
+        else:
+            hive.apply_preset(settings.preset, args.rows // 2, args.columns // 2)
+        return hive
+
+    hive = Colony(args.rows, args.columns, 1, settings)
+    if args.defect_fraction is not None:
+        hive.coop = hive.rng.random((args.rows, args.columns)) >= args.defect_fraction
+    else:
+        hive.apply_preset(settings.preset, args.rows // 2, args.columns // 2)
+    return hive
+
+# steps - generations computed in this run (a resumed run starts past generation 0)
+def summary(hive, changed, elapsed, steps):
+    rate = steps / elapsed if elapsed > 0 else float("inf")
+    return "gen %d  coop %.4f  changed %d  (%.1f gen/s)" % (hive.generation, hive.coop_fraction(), changed, rate)
+
+def save_grid(hive, path):
+    if isinstance(hive, PackedColony):
+        if path.endswith(".npz"):
+            hive.save(path)
+            return
+        coop = hive.unpack()
+    else:
+        coop = hive.coop
+
+    if path.endswith(".npy"):
+        np.save(path, coop)
+    else:
+        np.savetxt(path, coop.astype(np.uint8), fmt="%d", delimiter="")
+
+'''
+continues the run recorded in an existing trajectory file: the colony takes the grid and generation number of
+its last recorded generation; returns that generation, or None for a new file
+'''
+def resume_trajectory(hive, path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with Trajectory(path) as trajectory:
+        if (trajectory.rows, trajectory.columns) != (hive.rows, hive.columns):
+            raise ValueError("Trajectory %s is for a %dx%d grid" % (path, trajectory.rows, trajectory.columns))
+        if trajectory.last is None:
+            return None
+        hive.coop = trajectory.state(trajectory.last)
+        hive.generation = trajectory.last
+    return trajectory.last
+
+# one line of JSON per generation: the generation and, per strategy, the ClusterStats fields
+def write_clusters(f, stats):
+    line = {"generation": stats.generation}
+    for name in ("coop", "defect"):
+        clusters = getattr(stats, name)
+        line[name] = {"count": clusters.count, "largest": clusters.largest, "mean_size": clusters.mean_size,
+                      "perimeter": clusters.perimeter, "histogram": clusters.histogram.tolist()}
+    f.write(json.dumps(line) + "\n")
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = build_settings(args)
+    hive = build_colony(args, settings)
+    print(settings)
+
+    # before any stepper starts, so they all begin from the recorded grid
+    recorder = None
+    if args.record:
+        if isinstance(hive, PackedColony):
+            print("--record ignored: packed colonies do not track flipped cells")
+        else:
+            last = resume_trajectory(hive, args.record)
+            if last is not None:
+                print("continuing %s from generation %d" % (args.record, last))
+            recorder = TrajectoryWriter(args.record, hive, args.keyframe_every)
+    first = hive.generation
+
+    stepper = None
+    if args.schedule:
+        if isinstance(hive, PackedColony):
+            print("--schedule ignored: packed colonies update synchronously")
+        else:
+            stepper = AsyncScheduler(hive, SCHEDULE_ALIASES.get(args.schedule, args.schedule))
+            print("updating asynchronously: " + stepper.schedule)
+            if args.workers is not None:
+                print("--workers ignored: asynchronous updates run in one process")
+    elif args.workers is not None:
+        if isinstance(hive, PackedColony):
+            print("--workers ignored: packed colonies step in one process")
+        else:
+            stepper = ParallelStepper(hive, args.workers)
+            print("stepping in %d worker processes" % len(stepper.bands))
+
+    detector = None
+    if args.stop_on_cycle:
+        if isinstance(hive, PackedColony) or not hive.is_deterministic() or args.schedule:
+            print("--stop-on-cycle ignored: the updates are not deterministic or the colony is packed")
+        else:
+            detector = CycleDetector(hive, args.stop_on_cycle)
+
+    analyzer = None
+    if args.clusters:
+        if isinstance(hive, PackedColony):
+            print("--clusters ignored: packed colonies do not track flipped cells")
+        else:
+            analyzer = ClusterAnalyzer(hive, args.connectivity)
+            cluster_file = open(args.clusters, "w")
+            write_clusters(cluster_file, analyzer.stats())
+
+    phase_timer.enable(args.timing)
+
+    changed = 0
+    start = time.perf_counter()
+    for result in hive.generations(args.generations):
+        changed = result.changed
+        if recorder:
+            recorder.record()
+        if analyzer:
+            analyzer.update()
+            write_clusters(cluster_file, analyzer.stats())
+        if args.report_every and hive.generation % args.report_every == 0:
+            print(summary(hive, changed, time.perf_counter() - start, hive.generation - first))
+        if detector and detector.update():
+            break
+    elapsed = time.perf_counter() - start
+    if stepper:
+        stepper.close()
+    if recorder:
+        recorder.close()
+        print("trajectory written to " + args.record)
+    if analyzer:
+        cluster_file.close()
+        print("cluster statistics written to " + args.clusters)
+
+    steps = hive.generation - first
+    print(summary(hive, changed, elapsed, steps))
+    if detector and detector.found():
+        if detector.period == 1:
+            print("fixed point reached after %d generations" % detector.transient)
+        else:
+            print("cycle of period %d entered after %d generations" % (detector.period, detector.transient))
+    if elapsed > 0:
+        print("%d generations in %.3f s: %.2f generations/s, %.3g cell-updates/s"
+              % (steps, elapsed, steps / elapsed, steps * hive.rows * hive.columns / elapsed))
+
+    if args.timing:
+        print(phase_timer.report())
+
+    if args.out:
+        save_grid(hive, args.out)
+        print("final state saved to " + args.out)
+
+if __name__ == '__main__':
+    sys.exit(main())
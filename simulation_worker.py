@@ -0,0 +1,228 @@
+# Background stepping for the Colony
+# A SimulationWorker thread owns every change to a colony: generations, and edits submitted from other threads
+# (clicks, presets) and changes to the settings, which it applies between generations. Finished frames - a copy
+# of the strategy grid and the regions that changed - are handed over through a one-slot mailbox, so the
+# consumer never waits for a step and frames it has not had time to show are merged rather than queued.
+# The module does not import Qt; on_frame is called on the worker thread and should only schedule the redraw.
+# With a History, every state the worker produces is recorded, and the colony can be rewound to any of them.
+
+from collections import deque, namedtuple
+import threading
+import time
+
+import numpy as np
+
+# shortest time between two frames while the colony runs, seconds
+FRAME_INTERVAL = 1 / 60.0
+
+# generations per second are measured over this many of the latest generations
+RATE_WINDOW = 32
+
+'''
+one finished state of the colony
+regions - changed (r0, r1, c0, c1) cell ranges since the last frame that was taken, or None for the whole grid
+rate - generations per second while playing, 0 otherwise
+'''
+Frame = namedtuple("Frame", ["generation", "coop", "regions", "changed", "rate", "playing"])
+
+class SimulationWorker(threading.Thread):
+    def __init__(self, colony, on_frame=None, history=None):
+        super().__init__(daemon=True)
+        self.colony = colony
+        self.on_frame = on_frame                # called (without arguments) when a new frame is waiting
+        self.history = history
+
+        # shared with the controlling thread, guarded by condition
+        self.condition = threading.Condition()
+        self.edits = deque()
+        self.changes = deque()                  # settings changes, see configure()
+        self.playing = False
+        self.steps = 0
+        self.target_rate = None                 # generations per second while playing, None: as fast as possible
+        self.stopped = False
+        self.frame = None
+        self.rewind_to = None                   # history index the colony goes back to before its next change
+
+        # worker thread only
+        self.regions = [None]                   # the first frame shows the whole grid
+        self.changed = 0
+        self.due = 0.0
+        self.published = 0.0
+        self.shown = None                       # (generation, playing) of the last frame
+        self.times = deque(maxlen=RATE_WINDOW)
+
+        colony.add_listener(self.colony_changed)
+
+    ## controls, callable from any thread
+
+    def play(self):
+        with self.condition:
+            self.playing = True
+            self.times.clear()
+            self.condition.notify()
+
+    def pause(self):
+        with self.condition:
+            self.playing = False
+            self.steps = 0
+            self.condition.notify()
+
+    # computes n generations, then goes back to waiting
+    def step(self, n=1):
+        with self.condition:
+            self.steps += n
+            self.condition.notify()
+
+    # generations per second while playing; None or 0 runs as fast as possible
+    def set_rate(self, rate):
+        with self.condition:
+            self.target_rate = rate or None
+            self.due = 0.0
+            self.condition.notify()
+
+    '''
+    runs edit() on the worker thread before the next generation; every change to the colony made from
+    another thread must go through here
+    '''
+    def submit(self, edit):
+        with self.condition:
+            self.edits.append(edit)
+            self.condition.notify()
+
+    '''
+    runs change() on the worker thread before the next generation, so a generation never sees the settings
+    half changed; unlike submit(), the grid is left alone and a selected state of the history stays selected
+    '''
+    def configure(self, change):
+        with self.condition:
+            self.changes.append(change)
+            self.condition.notify()
+
+    '''
+    pauses and selects the i-th state of the history; the colony itself is only rewound (and the later
+    states forgotten) once the worker is given something else to do, so scrubbing back and forth is free
+    '''
+    def scrub(self, i):
+        with self.condition:
+            self.playing = False
+            self.steps = 0
+            self.rewind_to = i
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    # the latest frame, or None if there is nothing new since the last call
+    def take_frame(self):
+        with self.condition:
+            frame = self.frame
+            self.frame = None
+            return frame
+
+    ## worker thread
+
+    def colony_changed(self, region):
+        self.regions.append(region)
+
+    def has_work(self):
+        if self.stopped or self.edits or self.changes or self.steps:
+            return True
+        return self.playing and time.perf_counter() >= self.due
+
+    # how long to sleep when there is no work: until the next generation is due, or until woken up
+    def wait_time(self):
+        if self.playing:
+            return max(self.due - time.perf_counter(), 0.0)
+        return None
+
+    def rate(self):
+        if not self.playing or len(self.times) < 2 or self.times[-1] == self.times[0]:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
+
+    '''
+    puts the colony's current state in the mailbox; while running, at most one frame per FRAME_INTERVAL is
+    made. A frame that has not been taken yet is replaced, and its regions carried over to the new one
+    Frames without changed regions still carry the generation count and the rate
+    call with condition held
+    '''
+    def publish(self, force=False):
+        if not self.regions and self.shown == (self.colony.generation, self.playing):
+            return
+        now = time.perf_counter()
+        if not force and now - self.published < FRAME_INTERVAL:
+            return
+
+        regions = self.regions
+        if self.frame is not None and self.frame.regions is not None:
+            regions = self.frame.regions + regions
+        elif self.frame is not None:
+            regions = [None]
+        waiting = self.frame is not None
+
+        self.frame = Frame(self.colony.generation, self.colony.coop.copy(), None if None in regions else regions,
+                           self.changed, self.rate(), self.playing)
+        self.regions = []
+        self.published = now
+        self.shown = (self.colony.generation, self.playing)
+        if not waiting and self.on_frame:
+            self.on_frame()
+
+    # puts the colony back in the i-th state of the history; the random draws are keyed by generation, so the
+    # generations after it are drawn with the same numbers as before unless the grid or settings changed
+    def rewind(self, i):
+        generation, grid = self.history.truncate(i)
+        self.colony.coop = grid
+        self.colony.flipped = np.zeros(0, dtype=np.intp)
+        self.colony.generation = generation
+
+    def run(self):
+        if self.history is not None:
+            self.history.record(self.colony.coop, self.colony.generation)
+        while True:
+            with self.condition:
+                while not self.has_work():
+                    self.publish(force=True)
+                    self.condition.wait(self.wait_time())
+                if self.stopped:
+                    return
+
+                changes = list(self.changes)
+                self.changes.clear()
+                edits = list(self.edits)
+                self.edits.clear()
+                stepping = self.steps > 0 or (self.playing and time.perf_counter() >= self.due)
+                if stepping and self.steps > 0:
+                    self.steps -= 1         # a step asked for while playing is taken right away
+                rewind_to = None
+                if edits or stepping:
+                    rewind_to = self.rewind_to
+                    self.rewind_to = None
+
+            # the colony is only touched here, outside the lock, so the controls never wait for a generation
+            for change in changes:
+                change()
+            if rewind_to is not None:
+                self.rewind(rewind_to)
+            for edit in edits:
+                edit()
+            if edits and self.history is not None:
+                self.history.record(self.colony.coop, self.colony.generation)
+
+            if stepping:
+                start = time.perf_counter()
+                try:
+                    self.changed = self.colony.next_generation()
+                except ValueError as e:
+                    print(e)
+                    self.pause()
+                    continue
+                self.times.append(time.perf_counter())
+                if self.history is not None:
+                    self.history.record(self.colony.coop, self.colony.generation, self.colony.flipped)
+                if self.target_rate:
+                    self.due = start + 1.0 / self.target_rate
+
+            with self.condition:
+                self.publish()
@@ -0,0 +1,296 @@
+# Parallel parameter sweeps over ColonyParams
+# Every point of a parameter grid is run in a pool of worker processes (one per core, each single-threaded);
+# summary metrics are appended to one CSV file as points finish, so an interrupted sweep picks up where it left off.
+# The base parameters and run configuration are kept next to the CSV (results.csv.json); a sweep only resumes a
+# file written with the same ones.
+#
+# The grid is a JSON dictionary of parameter name -> list of values, e.g.
+#   {"threshold": [2, 3, 4], "payoff[2]": [1.2, 1.4, 1.6], "weight_func": ["Uniform", "Inverse Euclidean"]}
+# where "payoff[i]" sweeps a single entry of the payoff matrix.
+#   python sweep.py grid.json --rows 128 --columns 128 -n 500 --rule pbr --out results.csv
+
+import os
+
+# one thread per worker process; the pool itself uses every core
+for var in ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]:
+    os.environ.setdefault(var, "1")
+
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from colony import *
+from colonyParams import *
+from cycle_detector import *
+from ensemble import *
+
+METRICS = ["replicas", "generations", "coop_fraction", "coop_fraction_std", "mean_coop_fraction", "changed",
+           "period", "transient", "seconds"]
+
+'''
+every combination of the grid's values, as a list of {name: value} dictionaries in a fixed order
+'''
+def grid_points(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+# stable text key of a point, used to recognise finished points when resuming
+def point_key(point):
+    return json.dumps(point, sort_keys=True)
+
+'''
+ColonyParams for one point: the base parameters with the point's values applied
+'''
+def point_settings(base, point, seed):
+    settings = ColonyParams()
+    settings.update(base)
+
+    values = {}
+    for name, value in point.items():
+        if name.startswith("payoff["):
+            if "payoff" not in values:
+                values["payoff"] = list(settings.payoff)
+            values["payoff"][int(name[len("payoff["):-1])] = value
+        else:
+            values[name] = value
+    settings.update(values)
+    settings.seed = seed
+    return settings
+
+# colonies kept by each worker process between points, keyed by grid size
+_colonies = {}
+
+'''
+runs one point of the sweep in a worker process and returns its CSV row
+'''
+def run_point(task):
+    settings = point_settings(task["base"], task["point"], task["seed"])
+    rows, columns = task["rows"], task["columns"]
+    if task["replicas"] > 1:
+        return run_ensemble_point(task, settings)
+
+    if (rows, columns) not in _colonies:
+        _colonies[(rows, columns)] = Colony(rows, columns, 1, settings)
+    hive = _colonies[(rows, columns)]
+    hive.reset(settings)
+
+    if task["defect_fraction"] is not None:
+        hive.coop = hive.rng.random((rows, columns)) >= task["defect_fraction"]
+    else:
+        hive.apply_preset(settings.preset, rows // 2, columns // 2)
+
+    detector = None
+    if task["stop_on_cycle"] and hive.is_deterministic():
+        detector = CycleDetector(hive, task["stop_on_cycle"])
+
+    # average the cooperation fraction over the last generations of the run
+    average_from = task["generations"] - task["average_last"]
+    coop_sum = 0.0
+    coop_n = 0
+
+    changed = 0
+    start = time.perf_counter()
+    for g, result in enumerate(hive.generations(task["generations"])):
+        changed = result.changed
+        if g >= average_from:
+            coop_sum += result.coop_fraction
+            coop_n += 1
+        if detector and detector.update():
+            break
+
+    row = {"key": task["key"]}
+    row.update(task["point"])
+    row.update({"replicas": 1,
+                "generations": hive.generation,
+                "coop_fraction": hive.coop_fraction(),
+                "coop_fraction_std": 0.0,
+                # a run that stopped on a cycle keeps its final value
+                "mean_coop_fraction": coop_sum / coop_n if coop_n else hive.coop_fraction(),
+                "changed": changed,
+                "period": detector.period if detector and detector.found() else "",
+                "transient": detector.transient if detector and detector.found() else "",
+                "seconds": time.perf_counter() - start})
+    return row
+
+'''
+runs the replicas of one point together as a ColonyEnsemble; coop_fraction and its std are taken across replicas
+'''
+def run_ensemble_point(task, settings):
+    rows, columns = task["rows"], task["columns"]
+    ensemble = ColonyEnsemble(task["replicas"], rows, columns, settings)
+    if task["defect_fraction"] is not None:
+        ensemble.randomize(task["defect_fraction"])
+    else:
+        ensemble.apply_preset(settings.preset, rows // 2, columns // 2)
+
+    average_from = task["generations"] - task["average_last"]
+    coop_sum = 0.0
+    coop_n = 0
+
+    stats = None
+    start = time.perf_counter()
+    for g in range(task["generations"]):
+        stats = ensemble.next_generation()
+        if g >= average_from:
+            coop_sum += stats.mean_coop_fraction
+            coop_n += 1
+
+    row = {"key": task["key"]}
+    row.update(task["point"])
+    row.update({"replicas": task["replicas"],
+                "generations": ensemble.generation,
+                "coop_fraction": ensemble.coop_fraction().mean(),
+                "coop_fraction_std": ensemble.coop_fraction().std(),
+                "mean_coop_fraction": coop_sum / coop_n if coop_n else ensemble.coop_fraction().mean(),
+                "changed": stats.total_changed if stats else 0,
+                "period": "",
+                "transient": "",
+                "seconds": time.perf_counter() - start})
+    return row
+
+# file next to a results file that describes the sweep it holds
+def description_path(out):
+    return out + ".json"
+
+# everything besides the grid point that a row of results depends on, in its JSON form
+def sweep_description(grid, base, config):
+    return json.loads(json.dumps({"parameters": sorted(grid), "base": base, "config": config}, sort_keys=True))
+
+'''
+makes sure the existing results file at out holds the same sweep, so its points can be skipped and rows appended;
+raises ValueError otherwise
+'''
+def check_resume(out, description, fields):
+    if not os.path.exists(description_path(out)):
+        raise ValueError("%s has no sweep description (%s); use another --out" % (out, description_path(out)))
+    with open(description_path(out)) as f:
+        previous = json.load(f)
+    if previous.get("parameters") != description["parameters"]:
+        raise ValueError("%s holds a sweep over %s; use another --out"
+                         % (out, ", ".join(previous.get("parameters", []))))
+    for part in ["base", "config"]:
+        old, new = previous.get(part, {}), description[part]
+        changed = sorted(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+        if changed:
+            raise ValueError("%s holds a sweep with different %s values (%s); use another --out"
+                             % (out, part, ", ".join(changed)))
+    with open(out, newline="") as f:
+        header = next(csv.reader(f), fields)
+    if header != fields:
+        raise ValueError("%s has the columns %s instead of %s" % (out, ",".join(header), ",".join(fields)))
+
+# keys of the points already in an existing results file
+def finished_keys(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {row["key"] for row in csv.DictReader(f)}
+
+def worker_count(requested):
+    if requested:
+        return requested
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+'''
+runs every point of grid that is not yet in the results file at out, appending one row per point
+Params:
+grid - dictionary of parameter name -> list of values
+base - dictionary of ColonyParams values shared by all points
+config - rows, columns, replicas, generations, average_last, defect_fraction, stop_on_cycle, seed
+'''
+def run_sweep(grid, base, config, out, workers=None):
+    points = grid_points(grid)
+    fields = ["key"] + sorted(grid) + METRICS
+    description = sweep_description(grid, base, config)
+    new_file = not os.path.exists(out)
+    if new_file:
+        with open(description_path(out), "w") as f:
+            json.dump(description, f, indent=1, sort_keys=True)
+    else:
+        check_resume(out, description, fields)
+    done = finished_keys(out)
+
+    tasks = []
+    for index, point in enumerate(points):
+        key = point_key(point)
+        if key in done:
+            continue
+        seed = None
+        if config["seed"] is not None:
+            seed = int(np.random.SeedSequence([config["seed"], index]).generate_state(1)[0])
+        task = dict(config, base=base, point=point, key=key, seed=seed)
+        tasks.append(task)
+
+    print("%d points, %d already done, %d to run" % (len(points), len(points) - len(tasks), len(tasks)))
+    if not tasks:
+        return
+
+    with open(out, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        if new_file:
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=min(worker_count(workers), len(tasks))) as pool:
+            futures = [pool.submit(run_point, task) for task in tasks]
+            for n, future in enumerate(as_completed(futures), 1):
+                writer.writerow(future.result())
+                f.flush()       # every finished point survives an interruption
+                print("%d / %d points done" % (n, len(tasks)))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Sweep ColonyParams values over a process pool")
+    parser.add_argument("grid", help="JSON file of parameter name -> list of values")
+    parser.add_argument("--params", help="JSON file of ColonyParams values shared by every point")
+    parser.add_argument("--out", default="sweep.csv",
+                        help="CSV results file; points already in it are skipped if it holds the same sweep")
+    parser.add_argument("--rows", type=int, default=64)
+    parser.add_argument("--columns", type=int, default=64)
+    parser.add_argument("-n", "--generations", type=int, default=200)
+    parser.add_argument("--replicas", type=int, default=1,
+                        help="independent replicas per point, stepped together as one ensemble")
+    parser.add_argument("--rule", choices=list(RULE_ALIASES) + UPDATE_RULES)
+    parser.add_argument("--average-last", type=int, default=50, metavar="K",
+                        help="mean_coop_fraction averages the last K generations")
+    parser.add_argument("--defect-fraction", type=float,
+                        help="start from random defectors with this probability instead of the preset")
+    parser.add_argument("--stop-on-cycle", type=int, nargs="?", const=64, default=0, metavar="MAX_PERIOD",
+                        help="end a point early once a deterministic rule reaches a fixed point or short cycle")
+    parser.add_argument("--seed", type=int, help="base seed; every point gets its own stream derived from it")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per available core)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.grid) as f:
+        grid = json.load(f)
+
+    base = ColonyParams()
+    base.weight_func = WEIGHT_FUNCTIONS["Uniform"]
+    base.next_gen_type = "Perfect Best Response"
+    if args.params:
+        base.load(args.params)
+    if args.rule:
+        base.next_gen_type = RULE_ALIASES.get(args.rule, args.rule)
+
+    config = {"rows": args.rows,
+              "columns": args.columns,
+              "replicas": args.replicas,
+              "generations": args.generations,
+              "average_last": args.average_last,
+              "defect_fraction": args.defect_fraction,
+              "stop_on_cycle": args.stop_on_cycle,
+              "seed": args.seed}
+    try:
+        run_sweep(grid, base.as_dict(), config, args.out, args.workers)
+    except ValueError as e:
+        return "sweep.py: " + str(e)
+
+if __name__ == '__main__':
+    sys.exit(main())
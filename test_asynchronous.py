@@ -0,0 +1,96 @@
+# Asynchronous updates: locally maintained fields, batched rounds and the event lists
+#   python -m pytest test_asynchronous.py
+
+import numpy as np
+import pytest
+import asynchronous
+from asynchronous import *
+from neighborhood import *
+from weighting_functions import weight_kernel
+
+CASES = [("Threshold", {}),
+         ("Perfect Best Response", {}),
+         ("Perfect Best Response", {"weight": "Inverse Euclidean", "interaction_radius": 2, "imitation_radius": 2}),
+         ("Perfect Best Response", {"weight": "Inverse Manhattan", "interaction_radius": 2}),
+         ("Perfect Best Response", {"silence": 0.1, "stubbornness": 0.2}),
+         ("Irrational Best Response", {"beta": 2, "stubbornness": 0.1})]
+
+# the incrementally updated fields equal a recount from the grid, exactly
+def assert_fields_exact(scheduler, hive):
+    settings = hive.settings
+    if settings.next_gen_type == "Threshold":
+        assert np.array_equal(scheduler.defectors, count_neighbors(~hive.coop, 1).reshape(-1))
+        return
+    kernel = weight_kernel(settings.weight_func, settings.interaction_radius)
+    heard = ~hive.silent
+    for level, weight in enumerate(scheduler.levels):
+        taps = (kernel == weight).astype(float)
+        assert np.array_equal(scheduler.coop_counts[level],
+                              np.rint(neighbor_sum(hive.coop & heard, taps)).reshape(-1))
+        assert np.array_equal(scheduler.defect_counts[level],
+                              np.rint(neighbor_sum(~hive.coop & heard, taps)).reshape(-1))
+    assert np.array_equal(scheduler.p, scheduler.payoffs(np.arange(scheduler.cells)))
+
+# units run as attempts (at every cell, or while many are unstable) or as events (while few are)
+@pytest.mark.parametrize("max_event_fraction", [-1.0, 2.0])
+@pytest.mark.parametrize("schedule", SCHEDULES)
+@pytest.mark.parametrize("rule, extra", CASES)
+def test_fields_stay_exact(rule, extra, schedule, max_event_fraction, monkeypatch, make_colony):
+    monkeypatch.setattr(asynchronous, "MAX_EVENT_FRACTION", max_event_fraction)
+    hive = make_colony(rule, 48, 48, extra)
+    scheduler = AsyncScheduler(hive, schedule)
+    start = hive.coop.copy()
+    for g in range(6):
+        before = hive.coop.copy()
+        hive.next_generation()
+        assert_fields_exact(scheduler, hive)
+        assert np.array_equal(hive.flipped, np.flatnonzero(hive.coop != before))
+        if scheduler.rates is not None:         # the list of unstable cells follows the rates
+            rates = scheduler.switch_rates(np.arange(scheduler.cells))
+            assert np.allclose(rates, scheduler.rates)
+            assert set(scheduler.active[:scheduler.count].tolist()) == set(np.flatnonzero(rates > 0).tolist())
+    assert hive.generation == 6 and not np.array_equal(hive.coop, start)
+    scheduler.close()
+    assert hive.stepper is None
+
+# rounds of non-interacting attempts give the grid of the same attempts made one at a time
+@pytest.mark.parametrize("rule, extra", [CASES[0], CASES[1], CASES[2],
+                                         ("Irrational Best Response",
+                                          {"beta": 3, "stubbornness": 0.2, "silence": 0.1})])
+def test_rounds_equal_one_at_a_time(rule, extra, monkeypatch, make_colony):
+    grids = []
+    for chunk in (1, 777, 2 ** 16):
+        monkeypatch.setattr(asynchronous, "CHUNK", chunk)
+        monkeypatch.setattr(asynchronous, "CHUNK_FRACTION", 1.0)
+        hive = make_colony(rule, 40, 40, extra)
+        scheduler = AsyncScheduler(hive)
+        scheduler.prepare()
+        scheduler.attempts(np.random.default_rng(2), 5000)
+        assert_fields_exact(scheduler, hive)
+        grids.append(hive.coop.copy())
+    assert all(np.array_equal(grids[0], grid) for grid in grids)
+
+@pytest.mark.parametrize("schedule", SCHEDULES)
+def test_seeded_runs_repeat(schedule, make_colony):
+    runs = []
+    for repeat in range(2):
+        hive = make_colony("Irrational Best Response", 32, 32, {"beta": 2}, seed=11)
+        with AsyncScheduler(hive, schedule):
+            for result in hive.generations(5):
+                pass
+        runs.append(hive.coop.copy())
+    assert np.array_equal(runs[0], runs[1])
+
+# edits between units of time are picked up
+def test_edits_rebuild_the_fields(make_colony):
+    hive = make_colony("Perfect Best Response", 32, 32)
+    scheduler = AsyncScheduler(hive, "Gillespie")
+    hive.next_generation()
+    hive.coop = np.ones((32, 32), dtype=bool)
+    hive.cell(5, 5).flip()
+    hive.next_generation()
+    assert_fields_exact(scheduler, hive)
+
+def test_unknown_schedule(make_colony):
+    with pytest.raises(ValueError):
+        AsyncScheduler(make_colony("Threshold", 8, 8), "Synchronous")
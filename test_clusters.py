@@ -0,0 +1,120 @@
+# Incremental cluster statistics must match a plain flood fill of the whole torus
+#   python -m pytest test_clusters.py
+
+from collections import deque
+
+import numpy as np
+import pytest
+from clusters import *
+from colony import *
+from colonyParams import *
+from weighting_functions import uniform_w
+
+'''
+(size, perimeter) of every cluster of each strategy (1 coop, 0 defect), by breadth-first search on the torus
+'''
+def flood_fill(coop, connectivity):
+    rows, columns = coop.shape
+    sides = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    joined = sides + ([(1, 1), (1, -1), (-1, 1), (-1, -1)] if connectivity == 8 else [])
+    seen = np.zeros(coop.shape, dtype=bool)
+    clusters = {0: [], 1: []}
+    for r in range(rows):
+        for c in range(columns):
+            if seen[r, c]:
+                continue
+            strategy = coop[r, c]
+            queue = deque([(r, c)])
+            seen[r, c] = True
+            size = perimeter = 0
+            while queue:
+                a, b = queue.popleft()
+                size += 1
+                perimeter += sum(coop[(a + dr) % rows, (b + dc) % columns] != strategy for dr, dc in sides)
+                for dr, dc in joined:
+                    x, y = (a + dr) % rows, (b + dc) % columns
+                    if not seen[x, y] and coop[x, y] == strategy:
+                        seen[x, y] = True
+                        queue.append((x, y))
+            clusters[int(strategy)].append((size, perimeter))
+    return clusters
+
+def assert_matches(analyzer, coop):
+    expected = flood_fill(coop, analyzer.connectivity)
+    stats = analyzer.stats()
+    for strategy, found in ((1, stats.coop), (0, stats.defect)):
+        sizes = sorted((size for size, perimeter in expected[strategy]), reverse=True)
+        assert found.count == len(sizes)
+        assert found.largest == (sizes[0] if sizes else 0)
+        assert found.perimeter == sum(perimeter for size, perimeter in expected[strategy])
+        assert found.histogram.sum() == len(sizes)
+        assert list(analyzer.sizes(bool(strategy))) == sizes
+
+# tiles smaller than the grid, not dividing it, or larger than it; clusters wrapping around the torus
+@pytest.mark.parametrize("rows, columns, tile, connectivity, rule",
+                         [(30, 40, 8, 4, "Irrational Best Response"),
+                          (33, 17, 8, 8, "Irrational Best Response"),
+                          (50, 50, 16, 4, "Perfect Best Response"),
+                          (7, 9, 64, 4, "Irrational Best Response"),
+                          (40, 40, 8, 8, "Threshold"),
+                          (64, 70, 16, 8, "Irrational Best Response")])
+def test_incremental_updates_match_flood_fill(rows, columns, tile, connectivity, rule):
+    settings = ColonyParams()
+    settings.next_gen_type = rule
+    settings.weight_func = uniform_w
+    settings.seed = rows
+    settings.beta = 2
+    settings.threshold = 3
+    hive = Colony(rows, columns, 1, settings)
+    hive.coop = hive.rng.random((rows, columns)) >= 0.4
+
+    analyzer = ClusterAnalyzer(hive, connectivity, tile)
+    assert_matches(analyzer, hive.coop)
+    for g in range(12):
+        hive.next_generation()
+        analyzer.update()
+        if g == 6:          # an edit outside the rules needs a refresh
+            hive.cell(3, 3).flip()
+            analyzer.refresh()
+        assert_matches(analyzer, hive.coop)
+
+# few flips a generation: the clusters away from the relabeled tiles are kept, the others joined again
+@pytest.mark.parametrize("connectivity", [4, 8])
+@pytest.mark.parametrize("rule", ["Threshold", "Irrational Best Response"])
+def test_sparse_updates_match_flood_fill(connectivity, rule):
+    settings = ColonyParams()
+    settings.next_gen_type = rule
+    settings.weight_func = uniform_w
+    settings.seed = 3
+    settings.threshold = 2
+    settings.beta = 8
+    settings.stubbornness = 0.97
+    hive = Colony(48, 40, 1, settings)
+    if rule == "Threshold":     # a spreading pattern that wraps around the torus
+        hive.coop = np.ones((48, 40), dtype=bool)
+        hive.apply_preset("5x5 Defectors", 24, 37)
+    else:
+        hive.coop = hive.rng.random((48, 40)) >= 0.5
+
+    analyzer = ClusterAnalyzer(hive, connectivity, 8)
+    for g in range(24):
+        hive.next_generation()
+        analyzer.update()
+        assert_matches(analyzer, hive.coop)
+
+@pytest.mark.parametrize("connectivity", [4, 8])
+def test_uniform_grids_and_stripes(connectivity):
+    settings = ColonyParams()
+    hive = Colony(12, 20, 1, settings)
+    analyzer = ClusterAnalyzer(hive, connectivity, 8)
+    assert_matches(analyzer, hive.coop)         # one cluster covering the torus, no perimeter
+
+    stripes = np.zeros((12, 20), dtype=bool)
+    stripes[:, ::2] = True                      # every column a cluster closed by the wrap-around
+    hive.coop = stripes
+    analyzer.refresh()
+    assert_matches(analyzer, hive.coop)
+
+def test_unknown_connectivity():
+    with pytest.raises(ValueError):
+        ClusterAnalyzer(Colony(8, 8, 1, ColonyParams()), 6)
@@ -0,0 +1,45 @@
+# The vectorized threshold rule must match the original per-cell loop exactly
+#   python -m pytest test_dynamics.py
+
+import numpy as np
+import pytest
+from dynamics import *
+
+'''
+the original rule: every cell counts its cooperating neighbors among the 8 around it, wrapping around the
+edges, and defects when at least threshold of them defect
+'''
+def per_cell_threshold(coop, threshold):
+    rows, columns = coop.shape
+    lnext = np.ones((rows, columns), dtype=bool)
+    for r in range(rows):
+        for c in range(columns):
+            coop_n = 0
+            for dr in range(-1, 2):
+                for dc in range(-1, 2):
+                    if (dr != 0 or dc != 0) and coop[(r + dr) % rows, (c + dc) % columns]:
+                        coop_n += 1
+            if 8 - coop_n >= threshold:
+                lnext[r, c] = False
+    return lnext
+
+# every threshold up to the whole neighborhood; grids so small that neighbors wrap onto each other or the cell
+@pytest.mark.parametrize("threshold", range(10))
+@pytest.mark.parametrize("rows, columns", [(1, 1), (1, 5), (2, 2), (3, 3), (4, 7), (9, 6)])
+def test_threshold_step_matches_per_cell_rule(threshold, rows, columns):
+    rng = np.random.default_rng(rows * 10 + columns)
+    for fraction in (0.2, 0.5, 0.8):
+        coop = rng.random((rows, columns)) >= fraction
+        assert np.array_equal(threshold_step(coop, threshold), per_cell_threshold(coop, threshold))
+    for coop in (np.ones((rows, columns), dtype=bool), np.zeros((rows, columns), dtype=bool)):
+        assert np.array_equal(threshold_step(coop, threshold), per_cell_threshold(coop, threshold))
+
+# and so do generations of a Colony, which goes through the live tiles
+@pytest.mark.parametrize("threshold", range(10))
+def test_colony_generations_match_per_cell_rule(make_colony, threshold):
+    hive = make_colony("Threshold", 11, 13, {"threshold": threshold})
+    expected = hive.coop.copy()
+    for g in range(6):
+        expected = per_cell_threshold(expected, threshold)
+        hive.next_generation()
+        assert np.array_equal(hive.coop, expected)
@@ -0,0 +1,97 @@
+# The rewind history must give back every state it still holds, exactly
+#   python -m pytest test_history.py
+
+import numpy as np
+import pytest
+from colony import *
+from colonyParams import *
+from history import *
+from weighting_functions import uniform_w
+
+def noisy_colony(size=32):
+    settings = ColonyParams()
+    settings.next_gen_type = "Irrational Best Response"
+    settings.weight_func = uniform_w
+    settings.beta = 1
+    settings.seed = 4
+    hive = Colony(size, size, 1, settings)
+    hive.coop = hive.rng.random((size, size)) >= 0.5
+    return hive
+
+'''
+steps the colony, recording every generation (with its flipped cells when given_flips), and returns the
+grid of every generation
+'''
+def run(hive, history, generations, given_flips=True):
+    grids = {hive.generation: hive.coop.copy()}
+    history.record(hive.coop, hive.generation, hive.flipped if given_flips else None)
+    for g in range(generations):
+        hive.next_generation()
+        history.record(hive.coop, hive.generation, hive.flipped if given_flips else None)
+        grids[hive.generation] = hive.coop.copy()
+    return grids
+
+def assert_states(history, grids, order):
+    for i in order:
+        assert np.array_equal(history.state(i), grids[history.generation(i)])
+
+# budgets from a few states to all of them; keyframes at every state, every few, or only when flips outweigh one
+@pytest.mark.parametrize("budget", [600, 2000, HISTORY_BUDGET])
+@pytest.mark.parametrize("keyframe_every", [1, 3, 10, KEYFRAME_EVERY])
+@pytest.mark.parametrize("given_flips", [True, False])
+def test_states_match_the_run(budget, keyframe_every, given_flips):
+    history = History(budget, keyframe_every)
+    grids = run(noisy_colony(), history, 60, given_flips)
+
+    n = len(history)
+    assert history.generation(n - 1) == 60
+    assert [history.generation(i) for i in range(n)] == list(range(61 - n, 61))
+    if budget < HISTORY_BUDGET:
+        assert n < 61 and history.nbytes <= budget
+    else:
+        assert n == 61
+    assert history.snapshots[0].keyframe is not None and history.snapshots[0].flips is None
+    assert history.nbytes == sum(snapshot.nbytes() for snapshot in history.snapshots)
+
+    # scrubbing backwards, forwards and jumping around
+    assert_states(history, grids, range(n - 1, -1, -1))
+    assert_states(history, grids, range(n))
+    assert_states(history, grids, np.random.default_rng(0).permutation(n))
+    assert_states(history, grids, [-1, -n])
+
+@pytest.mark.parametrize("keyframe_every", [1, 4, KEYFRAME_EVERY])
+def test_truncate_and_record_again(keyframe_every):
+    hive = noisy_colony()
+    history = History(HISTORY_BUDGET, keyframe_every)
+    grids = run(hive, history, 20)
+
+    history.state(15)           # the cursor is ahead of the truncation
+    generation, grid = history.truncate(9)
+    assert generation == 9 and len(history) == 10
+    assert np.array_equal(grid, grids[9])
+
+    # the run goes on from there, as the worker does after a rewind
+    hive.coop = grid
+    hive.generation = generation
+    hive.flipped = np.zeros(0, dtype=np.intp)
+    grids.update(run(hive, history, 12))
+    assert len(history) == 22
+    assert_states(history, grids, range(len(history)))
+    assert_states(history, grids, range(len(history) - 1, -1, -1))
+
+def test_first_record_with_flips_is_a_keyframe():
+    history = History()
+    grid = np.ones((64, 64), dtype=bool)
+    history.record(grid, 1, np.array([0]))
+    assert np.array_equal(history.state(0), grid)
+
+    history.record(np.zeros((8, 8), dtype=bool), 2, np.array([3]))     # a new shape starts again
+    assert len(history) == 1 and not history.state(0).any()
+
+def test_unchanged_state_is_not_recorded():
+    history = History()
+    grid = np.zeros((8, 8), dtype=bool)
+    history.record(grid, 0)
+    history.record(grid, 0)
+    history.record(grid, 1)
+    assert [history.generation(i) for i in range(len(history))] == [0, 1]
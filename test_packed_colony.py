@@ -0,0 +1,66 @@
+# The bit-packed colony must match the boolean one
+#   python -m pytest test_packed_colony.py
+
+import numpy as np
+import pytest
+from colony import *
+from colonyParams import *
+from packed_colony import *
+
+def threshold_settings(threshold):
+    settings = ColonyParams()
+    settings.next_gen_type = "Threshold"
+    settings.threshold = threshold
+    settings.seed = 7
+    return settings
+
+@pytest.mark.parametrize("columns", [1, 5, 63, 64, 65, 130, 200])
+def test_pack_unpack_round_trip(columns):
+    grid = np.random.default_rng(columns).random((9, columns)) >= 0.5
+    words = pack_bits(grid)
+    assert words.dtype == WORD and words.shape == (9, -(-columns // WORD_BITS))
+    assert np.array_equal(unpack_bits(words, columns), grid)
+    assert not np.any(words[:, -1] & ~last_word_mask(columns))      # unused bits stay zero
+
+# every threshold up to the whole neighborhood, on widths that end inside a word or on a word boundary
+@pytest.mark.parametrize("threshold", [0, 1, 2, 2.5, 3, 4, 5, 8, 9])
+@pytest.mark.parametrize("rows, columns", [(40, 70), (3, 64), (17, 128), (31, 3), (2, 200)])
+def test_same_generations_as_boolean_colony(threshold, rows, columns):
+    settings = threshold_settings(threshold)
+    hive = Colony(rows, columns, 1, settings)
+    packed = PackedColony(rows, columns, 1, settings)
+    grid = np.random.default_rng(rows * columns).random((rows, columns)) >= 0.4
+    hive.coop = grid.copy()
+    packed.coop = pack_bits(grid)
+
+    for g in range(8):
+        assert packed.next_generation() == hive.next_generation()
+        assert np.array_equal(packed.unpack(), hive.coop)
+        assert packed.coop_fraction() == hive.coop_fraction()
+
+def test_presets_and_cells_match_boolean_colony():
+    settings = threshold_settings(3)
+    for name in PRESETS:
+        hive = Colony(30, 90, 1, settings)
+        packed = PackedColony(30, 90, 1, settings)
+        hive.apply_preset(name, 0, 89)          # wraps around both edges
+        packed.apply_preset(name, 0, 89)
+        assert np.array_equal(packed.unpack(), hive.coop)
+
+    packed.flip(5, 70)
+    assert not packed.get_coop(5, 70) and packed.get_coop(5, 71)
+
+def test_save_and_load(tmp_path):
+    packed = PackedColony(20, 100, 1, threshold_settings(3))
+    packed.randomize(0.3)
+    packed.next_generation()
+    packed.save(tmp_path / "packed.npz")
+    loaded = load_packed_colony(tmp_path / "packed.npz", 1, packed.settings)
+    assert np.array_equal(loaded.coop, packed.coop) and loaded.generation == 1
+
+@pytest.mark.parametrize("change", [{"next_gen_type": "Perfect Best Response"}, {"interaction_radius": 2}])
+def test_unsupported_settings_are_rejected(change):
+    settings = threshold_settings(3)
+    settings.update(change)
+    with pytest.raises(ValueError):
+        PackedColony(8, 8, 1, settings).next_generation()
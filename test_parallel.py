@@ -0,0 +1,74 @@
+# Parallel stepping must give exactly the generations of serial stepping
+#   python -m pytest test_parallel.py
+
+import numpy as np
+import pytest
+from parallel import *
+
+CASES = [("Threshold", 40, 70, {}),
+         ("Threshold", 67, 32, {"interaction_radius": 3}),
+         ("Perfect Best Response", 70, 45, {}),
+         ("Perfect Best Response", 65, 40, {"weight": "Inverse Euclidean", "interaction_radius": 2,
+                                            "imitation_radius": 2}),
+         ("Perfect Best Response", 64, 64, {"silence": 0.1, "stubbornness": 0.1}),
+         ("Irrational Best Response", 64, 50, {"silence": 0.05, "stubbornness": 0.1, "beta": 2})]
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+@pytest.mark.parametrize("rule, rows, columns, extra", CASES)
+def test_same_generations_as_serial(rule, rows, columns, extra, workers, make_colony):
+    serial = make_colony(rule, rows, columns, extra)
+    shared = make_colony(rule, rows, columns, extra)
+    with ParallelStepper(shared, workers):
+        for g in range(12):
+            if g == 6:          # an edit between generations reaches the workers
+                serial.cell(3, 4).flip()
+                shared.cell(3, 4).flip()
+            assert serial.next_generation() == shared.next_generation()
+            assert np.array_equal(serial.coop, shared.coop)
+            assert np.array_equal(serial.flipped, shared.flipped)
+            assert serial.coop_fraction() == shared.coop_fraction()
+
+    # after close() the colony keeps private arrays and steps serially again
+    assert shared.stepper is None
+    serial.next_generation()
+    shared.next_generation()
+    assert np.array_equal(serial.coop, shared.coop)
+
+# a small spreading pattern is stepped through the live tiles of every band only
+@pytest.mark.parametrize("rule", ["Threshold", "Perfect Best Response"])
+def test_sparse_generations(rule, make_colony):
+    serial = make_colony(rule, 200, 130, {"threshold": 2})
+    shared = make_colony(rule, 200, 130, {"threshold": 2})
+    for hive in (serial, shared):
+        hive.coop = np.ones((200, 130), dtype=bool)
+        hive.apply_preset("5x5 Defectors", 100, 65)
+    with ParallelStepper(shared, 4):
+        for g in range(30):
+            serial.next_generation()
+            shared.next_generation()
+            assert np.array_equal(serial.coop, shared.coop)
+            assert np.array_equal(serial.flipped, shared.flipped)
+
+def test_new_grid_reaches_the_workers(make_colony):
+    serial = make_colony("Threshold", 64, 40)
+    shared = make_colony("Threshold", 64, 40)
+    with ParallelStepper(shared, 2):
+        shared.next_generation()
+        serial.next_generation()
+        grid = np.random.default_rng(1).random((64, 40)) >= 0.5
+        serial.coop = grid.copy()
+        shared.coop = grid.copy()
+        for g in range(3):
+            serial.next_generation()
+            shared.next_generation()
+        assert np.array_equal(serial.coop, shared.coop)
+
+def test_worker_error_is_raised_and_recovered(make_colony):
+    hive = make_colony("Threshold", 64, 40)
+    with ParallelStepper(hive, 2):
+        hive.settings.threshold = None
+        with pytest.raises(RuntimeError):
+            hive.next_generation()
+        hive.settings.threshold = 3
+        hive.next_generation()
+        assert hive.generation == 1
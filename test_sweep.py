@@ -0,0 +1,91 @@
+# A sweep must resume an interrupted results file, and only a file of the same sweep
+#   python -m pytest test_sweep.py
+
+import csv
+import os
+
+import pytest
+from colonyParams import *
+from sweep import *
+
+GRID = {"threshold": [2, 3, 4], "payoff[2]": [1.2, 1.6]}
+
+def base_params(**values):
+    base = ColonyParams()
+    base.weight_func = WEIGHT_FUNCTIONS["Uniform"]
+    base.next_gen_type = "Threshold"
+    base.update(values)
+    return base.as_dict()
+
+def sweep_config(**values):
+    config = {"rows": 16, "columns": 16, "replicas": 1, "generations": 20, "average_last": 5,
+              "defect_fraction": 0.3, "stop_on_cycle": 0, "seed": 3}
+    config.update(values)
+    return config
+
+def read_rows(out):
+    with open(out, newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_interrupted_sweep_runs_only_the_missing_points(tmp_path, capsys):
+    whole = str(tmp_path / "whole.csv")
+    run_sweep(GRID, base_params(), sweep_config(), whole, workers=1)
+    expected = {row["key"]: row for row in read_rows(whole)}
+    assert len(expected) == 6
+
+    # an interruption after the header and two rows
+    out = str(tmp_path / "results.csv")
+    run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+    with open(out) as f:
+        lines = f.readlines()
+    with open(out, "w") as f:
+        f.writelines(lines[:3])
+    kept = read_rows(out)
+    assert finished_keys(out) == {row["key"] for row in kept}
+
+    capsys.readouterr()
+    run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+    assert "6 points, 2 already done, 4 to run" in capsys.readouterr().out
+    rows = read_rows(out)
+    assert rows[:2] == kept                 # finished rows are left alone
+    assert sorted(row["key"] for row in rows) == sorted(expected)
+    for row in rows:                        # every point has its own seed, however it is reached
+        assert row["coop_fraction"] == expected[row["key"]]["coop_fraction"]
+
+    # nothing left to do; more values of the same parameters only run the new points
+    run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+    assert "0 to run" in capsys.readouterr().out
+    run_sweep(dict(GRID, threshold=[2, 3, 4, 5]), base_params(), sweep_config(), out, workers=1)
+    assert "8 points, 6 already done, 2 to run" in capsys.readouterr().out
+    assert len(read_rows(out)) == 8
+
+@pytest.mark.parametrize("grid, base, config", [(GRID, base_params(), sweep_config(generations=30)),
+                                                (GRID, base_params(), sweep_config(replicas=2)),
+                                                (GRID, base_params(stubbornness=0.1), sweep_config()),
+                                                (GRID, base_params(next_gen_type="Perfect Best Response"),
+                                                 sweep_config()),
+                                                ({"threshold": [2, 3]}, base_params(), sweep_config()),
+                                                (dict(GRID, beta=[1]), base_params(), sweep_config())])
+def test_other_sweep_is_rejected(tmp_path, grid, base, config):
+    out = str(tmp_path / "results.csv")
+    run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+    with open(out) as f:
+        before = f.read()
+    with pytest.raises(ValueError):
+        run_sweep(grid, base, config, out, workers=1)
+    with open(out) as f:
+        assert f.read() == before
+
+def test_file_without_description_or_with_other_columns_is_rejected(tmp_path):
+    out = str(tmp_path / "results.csv")
+    run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+    with open(out) as f:
+        lines = f.readlines()
+    with open(out, "w") as f:
+        f.writelines([lines[0].replace("seconds", "elapsed")] + lines[1:])
+    with pytest.raises(ValueError):
+        run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
+
+    os.remove(description_path(out))
+    with pytest.raises(ValueError):
+        run_sweep(GRID, base_params(), sweep_config(), out, workers=1)
@@ -0,0 +1,103 @@
+# Trajectory files must give back every recorded generation, also after a crash or an appended run
+#   python -m pytest test_trajectory.py
+
+import numpy as np
+import pytest
+from colony import *
+from colonyParams import *
+from run_colony import resume_trajectory
+from trajectory import *
+from weighting_functions import uniform_w
+
+ROWS, COLUMNS = 40, 70          # rows of one and a bit packed words
+
+def noisy_colony():
+    settings = ColonyParams()
+    settings.next_gen_type = "Irrational Best Response"
+    settings.weight_func = uniform_w
+    settings.beta = 1
+    settings.seed = 8
+    hive = Colony(ROWS, COLUMNS, 1, settings)
+    hive.coop = np.random.default_rng(8).random((ROWS, COLUMNS)) >= 0.5
+    return hive
+
+'''
+records the colony for some generations; after generation edit_at a cell is flipped outside the update
+rules and a keyframe written; returns the grid of every recorded generation
+'''
+def record_run(hive, path, generations, keyframe_every=KEYFRAME_EVERY, edit_at=None):
+    grids = {hive.generation: hive.coop.copy()}
+    with TrajectoryWriter(path, hive, keyframe_every) as writer:
+        for g in range(generations):
+            hive.next_generation()
+            writer.record()
+            if hive.generation == edit_at:
+                hive.cell(5, 66).flip()
+                writer.keyframe()
+            grids[hive.generation] = hive.coop.copy()
+    return grids
+
+def assert_matches(path, grids):
+    with Trajectory(path) as trajectory:
+        assert trajectory.generations == sorted(grids)
+        for generation, grid in grids.items():
+            assert np.array_equal(trajectory.state(generation), grid)
+        for generation, grid in trajectory.states():
+            assert np.array_equal(grid, grids[generation])
+
+@pytest.mark.parametrize("keyframe_every", [1, 4, KEYFRAME_EVERY])
+def test_states_match_the_run(tmp_path, keyframe_every):
+    path = tmp_path / "run.traj"
+    grids = record_run(noisy_colony(), path, 30, keyframe_every, edit_at=12)
+    assert_matches(path, grids)
+
+    with Trajectory(path) as trajectory:
+        assert (trajectory.rows, trajectory.columns, trajectory.keyframe_every) == (ROWS, COLUMNS, keyframe_every)
+        assert 12 in trajectory.keyframes
+        states = [(generation, grid.copy()) for generation, grid in trajectory.states(10, 20)]
+        assert [generation for generation, grid in states] == list(range(10, 20))
+        assert all(np.array_equal(grid, grids[generation]) for generation, grid in states)
+
+def test_truncated_record_is_dropped_and_overwritten(tmp_path):
+    path = tmp_path / "run.traj"
+    hive = noisy_colony()
+    grids = record_run(hive, path, 10, keyframe_every=4)
+    with open(path, "r+b") as f:            # a crash in the middle of the last record
+        f.truncate(path.stat().st_size - 3)
+    del grids[10]
+    assert_matches(path, grids)
+
+    # appending overwrites the broken record
+    hive.coop = grids[9]
+    hive.generation = 9
+    grids.update(record_run(hive, path, 5, keyframe_every=4))
+    assert_matches(path, grids)
+
+# a run resumed from the file, as run_colony --record does, goes on exactly like an uninterrupted one
+def test_resumed_run_appends(tmp_path):
+    whole = tmp_path / "whole.traj"
+    path = tmp_path / "parts.traj"
+    grids = record_run(noisy_colony(), whole, 20, keyframe_every=8)
+
+    assert resume_trajectory(noisy_colony(), path) is None
+    record_run(noisy_colony(), path, 11, keyframe_every=8)
+    hive = noisy_colony()
+    assert resume_trajectory(hive, path) == 11 and hive.generation == 11
+    assert np.array_equal(hive.coop, grids[11])
+    record_run(hive, path, 9, keyframe_every=8)
+    assert_matches(path, grids)
+
+    with pytest.raises(ValueError):         # generations only go forward
+        with TrajectoryWriter(path, noisy_colony()):
+            pass
+
+def test_other_grid_size_is_rejected(tmp_path):
+    path = tmp_path / "run.traj"
+    record_run(noisy_colony(), path, 3)
+    other = Colony(ROWS, COLUMNS + 1, 1, ColonyParams())
+    with pytest.raises(ValueError):
+        resume_trajectory(other, path)
+    with pytest.raises(ValueError):
+        TrajectoryWriter(path, other)
+    with Trajectory(path) as trajectory:    # the file is left as it was
+        assert trajectory.last == 3
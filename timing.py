@@ -0,0 +1,135 @@
+# Per-phase timing of the update rules
+# The rules mark the end of each phase on a lap object, e.g.
+#     lap = phase_timer.start()
+#     ...refresh the silence map...
+#     lap.lap("silence")
+# A phase that recurs within one step, such as the payoff of every window of a sparse generation, is marked
+# with lap.part() instead and recorded once, summed, by lap.end_parts().
+# While the timer is disabled (the default) start() hands out a shared object whose lap() does nothing,
+# so the instrumentation costs one method call per phase. Enable it at runtime with phase_timer.enable().
+
+from math import frexp
+import time
+
+# histogram buckets are powers of two microseconds: bucket b counts times in [2^(b-1), 2^b) us
+BUCKETS = 32
+
+'''
+count, total, extremes and a log2 histogram of the times spent in one phase
+'''
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.histogram = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.histogram[min(max(frexp(seconds * 1e6)[1], 0), BUCKETS - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # upper bound (seconds) of the histogram bucket holding the q-th quantile
+    def quantile(self, q):
+        seen = 0
+        for b, n in enumerate(self.histogram):
+            seen += n
+            if seen >= q * self.count and n:
+                return 2.0 ** b / 1e6
+        return 0.0
+
+    def as_dict(self):
+        return {"count": self.count, "total": self.total, "mean": self.mean(),
+                "min": self.min if self.count else 0.0, "max": self.max, "histogram": list(self.histogram)}
+
+class Lap:
+    __slots__ = ["timer", "last", "parts"]
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.last = time.perf_counter()
+        self.parts = {}
+
+    '''
+    the phase that started at the previous lap (or at start()) ends now
+    inside - seconds of it already recorded as other phases (e.g. measured in worker processes)
+    '''
+    def lap(self, phase, inside=0.0):
+        now = time.perf_counter()
+        self.timer.add(phase, max(now - self.last - inside, 0.0))
+        self.last = now
+
+    # a part of a recurring phase ends now; its time is added to the phase's total for this step
+    def part(self, phase):
+        now = time.perf_counter()
+        self.parts[phase] = self.parts.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    # records every phase marked with part() since the last call, once each
+    def end_parts(self):
+        for phase, seconds in self.parts.items():
+            self.timer.add(phase, seconds)
+        self.parts = {}
+
+class NoLap:
+    __slots__ = []
+
+    def lap(self, phase, inside=0.0):
+        pass
+
+    def part(self, phase):
+        pass
+
+    def end_parts(self):
+        pass
+
+NO_LAP = NoLap()
+
+class PhaseTimer:
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}        # phase name -> PhaseStats
+
+    def enable(self, on=True):
+        self.enabled = on
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.phases = {}
+
+    def start(self):
+        return Lap(self) if self.enabled else NO_LAP
+
+    def add(self, phase, seconds):
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.add(seconds)
+
+    def as_dict(self):
+        return {phase: stats.as_dict() for phase, stats in self.phases.items()}
+
+    '''
+    one line per phase, the most expensive first: calls, total and mean time, median and 99th percentile
+    (to the histogram's power-of-two resolution), and share of the total
+    '''
+    def report(self):
+        grand_total = sum(stats.total for stats in self.phases.values()) or 1.0
+        lines = ["%-10s %8s %10s %10s %10s %10s %6s" % ("phase", "calls", "total s", "mean ms", "p50 ms",
+                                                      "p99 ms", "share")]
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            lines.append("%-10s %8d %10.3f %10.3f %10.3f %10.3f %5.1f%%"
+                         % (phase, stats.count, stats.total, stats.mean() * 1e3, stats.quantile(0.5) * 1e3,
+                            stats.quantile(0.99) * 1e3, 100 * stats.total / grand_total))
+        return "\n".join(lines)
+
+# the timer used by the Colony update rules
+phase_timer = PhaseTimer()
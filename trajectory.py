@@ -0,0 +1,247 @@
+# On-disk trajectories of Colony runs
+# A trajectory file is a header followed by an append-only list of records, one per generation:
+#   keyframe - the whole strategy grid in the packed_colony word format (one bit per cell, uncompressed,
+#              so it can be used straight from a memory map)
+#   delta    - the flat indices of the cells that flipped since the previous generation, as zlib-compressed
+#              gaps between sorted indices
+# A keyframe is written every keyframe_every generations, so generation k is rebuilt from the nearest
+# keyframe at or before k plus at most keyframe_every - 1 deltas. Records are padded to whole 64-bit words so
+# keyframes stay aligned in the map. A record cut short by a crash is ignored
+# by the reader and overwritten when the file is appended to.
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+from packed_colony import WORD, WORD_BITS, pack_bits, unpack_bits
+
+MAGIC = b"SGTRAJ01"
+
+# magic, rows, columns, keyframe_every, padding
+HEADER = struct.Struct("<8sIIIxxxx")
+
+# kind, payload length, generation; followed by the payload and its padding
+RECORD = struct.Struct("<BxxxIQ")
+ALIGN = 8
+KEYFRAME = 1
+DELTA = 2
+
+KEYFRAME_EVERY = 256
+
+# records waiting for the writer thread; recording blocks when it falls this far behind
+QUEUE_SIZE = 256
+
+def encode_flips(flipped):
+    gaps = np.diff(np.sort(flipped), prepend=0).astype("<u4")
+    return zlib.compress(gaps.tobytes(), 1)
+
+def padded(length):
+    return -(-length // ALIGN) * ALIGN
+
+def decode_flips(payload):
+    gaps = np.frombuffer(zlib.decompress(payload), dtype="<u4")
+    return np.cumsum(gaps, dtype=np.int64)
+
+'''
+reads the header and the complete records of an open trajectory file
+returns (rows, columns, keyframe_every, records, end), where records is a list of (kind, generation, offset,
+length) with offset the position of the payload, and end is the position just past the last complete record
+'''
+def scan(f):
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    magic, rows, columns, keyframe_every = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a colony trajectory file: " + str(f.name))
+
+    records = []
+    end = HEADER.size
+    while end + RECORD.size <= size:
+        f.seek(end)
+        kind, length, generation = RECORD.unpack(f.read(RECORD.size))
+        if end + RECORD.size + padded(length) > size:
+            break
+        records.append((kind, generation, end + RECORD.size, length))
+        end += RECORD.size + padded(length)
+    return rows, columns, keyframe_every, records, end
+
+'''
+Records a Colony run from the thread that steps it; packing, compression and file writes happen on a
+background thread. Call record() after every generation. Edits made outside the update rules are not in
+Colony.flipped, so follow them with keyframe().
+An existing file for a grid of the same size is appended to.
+'''
+class TrajectoryWriter:
+    def __init__(self, path, colony, keyframe_every=KEYFRAME_EVERY):
+        self.colony = colony
+        self.keyframe_every = keyframe_every
+        self.last = None
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, "r+b")
+            rows, columns, self.keyframe_every, records, end = scan(self.file)
+            if (rows, columns) != (colony.rows, colony.columns):
+                self.file.close()
+                raise ValueError("Trajectory %s is for a %dx%d grid" % (path, rows, columns))
+            if records:
+                self.last = records[-1][1]
+            self.file.seek(end)
+            self.file.truncate()
+        else:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, colony.rows, colony.columns, keyframe_every))
+
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self.write_records, daemon=True)
+        self.thread.start()
+
+        self.keyframe()
+
+    # queues the colony's whole grid as a keyframe of the current generation
+    def keyframe(self):
+        generation = self.colony.generation
+        if self.last is not None and generation < self.last:
+            raise ValueError("Trajectory already goes up to generation %d" % self.last)
+        self.put((KEYFRAME, generation, self.colony.coop.copy()))
+        self.last_keyframe = generation
+
+    '''
+    queues the generation the colony just computed: a keyframe every keyframe_every generations, or when the
+    previous generation was not recorded, and otherwise the cells that flipped
+    '''
+    def record(self):
+        generation = self.colony.generation
+        if generation == self.last:
+            return
+        if generation != self.last + 1 or generation - self.last_keyframe >= self.keyframe_every:
+            self.keyframe()
+        else:
+            self.put((DELTA, generation, self.colony.flipped))
+
+    def put(self, item):
+        if self.error:
+            raise self.error
+        self.queue.put(item)
+        self.last = item[1]
+
+    # writer thread
+    def write_records(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error:
+                continue
+            try:
+                kind, generation, data = item
+                if kind == KEYFRAME:
+                    payload = pack_bits(data).tobytes()
+                else:
+                    payload = encode_flips(data)
+                self.file.write(RECORD.pack(kind, len(payload), generation))
+                self.file.write(payload)
+                self.file.write(bytes(padded(len(payload)) - len(payload)))
+            except Exception as e:
+                self.error = e
+
+    # waits for every queued record to be written, then closes the file
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+'''
+Random access to a trajectory file through a memory map; keyframes are read without copying
+'''
+class Trajectory:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.rows, self.columns, self.keyframe_every, records, end = scan(f)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if end > HEADER.size else None
+
+        # generation -> (offset, length); a later record of the same generation replaces an earlier one
+        self.keyframes = {}
+        self.deltas = {}
+        for kind, generation, offset, length in records:
+            (self.keyframes if kind == KEYFRAME else self.deltas)[generation] = (offset, length)
+        self.keyframe_generations = sorted(self.keyframes)
+
+        self.generations = sorted(set(self.keyframes) | set(self.deltas))
+        self.first = self.generations[0] if self.generations else None
+        self.last = self.generations[-1] if self.generations else None
+
+    def __len__(self):
+        return len(self.generations)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # packed words of the keyframe of a generation, as a read-only view of the file
+    def keyframe_words(self, generation):
+        offset, length = self.keyframes[generation]
+        words = np.frombuffer(self.map, dtype=WORD, count=length // WORD.itemsize, offset=offset)
+        return words.reshape(self.rows, -(-self.columns // WORD_BITS))
+
+    # flat indices (r * columns + c) of the cells that flipped going into a generation
+    def flips(self, generation):
+        offset, length = self.deltas[generation]
+        return decode_flips(self.map[offset:offset + length])
+
+    # the keyframe at or before a generation
+    def keyframe_before(self, generation):
+        i = np.searchsorted(self.keyframe_generations, generation, side="right")
+        if i == 0:
+            raise KeyError("No keyframe at or before generation %d" % generation)
+        return self.keyframe_generations[i - 1]
+
+    '''
+    boolean strategy grid of a generation, rebuilt from the nearest keyframe and the deltas after it
+    '''
+    def state(self, generation):
+        start = self.keyframe_before(generation)
+        grid = unpack_bits(self.keyframe_words(start), self.columns)
+        flat = grid.reshape(-1)
+        for g in range(start + 1, generation + 1):
+            if g not in self.deltas:
+                raise KeyError("Generation %d is not in the trajectory" % g)
+            flat[self.flips(g)] ^= True
+        return grid
+
+    '''
+    yields (generation, grid) for generations start to stop - 1, applying one delta per step; the grid is
+    updated in place, so copy it to keep a state
+    '''
+    def states(self, start=None, stop=None):
+        start = self.first if start is None else start
+        stop = self.last + 1 if stop is None else stop
+        grid = self.state(start)
+        flat = grid.reshape(-1)
+        yield start, grid
+        for g in range(start + 1, stop):
+            if g in self.keyframes:       # a keyframe also catches edits made between generations
+                flat[:] = unpack_bits(self.keyframe_words(g), self.columns).reshape(-1)
+            else:
+                flat[self.flips(g)] ^= True
+            yield g, grid
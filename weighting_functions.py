@@ -5,9 +5,14 @@
 ## Weighting functions/Parameters for distance (move into GUI)
 # degrees of influence (primary/secondary sources have proportionally weighted influence; tertiary later)
 # specify a distance/weighting function that takes two cell locations and computes a weighting for the influence
+# weight_kernel turns such a function into an offset-indexed kernel; the colony only ever evaluates
+# it on offsets (0, 0) -> (dr, dc), so the distances respect the torus
+
+from functools import lru_cache
+import numpy as np
 
 def inv_euclidean(r1, c1, r2, c2):
-    dist = ((r2-r1) * (r2-r1)) + ((c2-c1) * (c2-c1))        # fix this so it's modular (respects torus)
+    dist = ((r2-r1) * (r2-r1)) + ((c2-c1) * (c2-c1))
     if dist != 0:
         return 1/dist
     return 0
@@ -20,3 +25,22 @@ def inv_manhattan(r1, c1, r2, c2):
 
 def uniform_w(r1, c1, r2, c2):
     return 1
+
+# weighting functions by the name shown in the GUI
+WEIGHT_FUNCTIONS = {"Uniform": uniform_w, "Inverse Manhattan": inv_manhattan, "Inverse Euclidean": inv_euclidean}
+
+'''
+Offset-indexed kernel of a weighting function: kernel[radius + dr, radius + dc] is the weighting
+of the neighbor at offset (dr, dc); the central pixel gets no weight
+Kernels are built once per (weight_func, radius) and shared, so they are read-only
+'''
+@lru_cache(maxsize=None)
+def weight_kernel(weight_func, radius=1):
+    kernel = np.zeros((2 * radius + 1, 2 * radius + 1))
+    for dr in range(-radius, radius + 1):
+        for dc in range(-radius, radius + 1):
+            if dr != 0 or dc != 0:
+                kernel[radius + dr, radius + dc] = weight_func(0, 0, dr, dc)
+
+    kernel.setflags(write=False)
+    return kernel